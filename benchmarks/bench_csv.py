@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# Compare rows per second of file.yield_csv_file_row (dict per row), file.yield_csv_file_batch and
+# file.yield_csv_file_batch_parallel
+# python3 benchmarks/bench_csv.py [row_count]
+import os
+import sys
+import tempfile
+import time
+from helpers import file
+
+
+def build_input_file(file_path, row_count):
+    with open(file_path, 'w') as fh:
+        fh.write('id,name,amount,created_date,status,comment\n')
+        for i in range(row_count):
+            fh.write(f'{i},name {i},{i * 1.5},2021-01-01 07:00:00,{"" if i % 3 else "active"},\n')
+
+
+def run(name, row_count, rows):
+    start_time = time.time()
+    count = 0
+    for batch in rows:
+        count += batch
+    elapsed = time.time() - start_time
+    assert count == row_count
+    print(f"{name}: {elapsed:.2f}s, {row_count / elapsed:,.0f} rows/s")
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.csv')
+        build_input_file(file_path, row_count)
+
+        run('dict per row', row_count, (1 for _ in file.yield_csv_file_row(file_path)))
+        run('batch rows', row_count, (len(batch) for batch in file.yield_csv_file_batch(file_path)))
+        run('batch columns', row_count, (len(batch['id'])
+                                         for batch in file.yield_csv_file_batch(file_path, output='columns')))
+        run('parallel batch rows', row_count, (len(batch)
+                                               for batch in file.yield_csv_file_batch_parallel(file_path)))
+        run('parallel batch rows, no safe_mode', row_count,
+            (len(batch) for batch in file.yield_csv_file_batch_parallel(file_path, safe_mode=False)))
+        if file.np is not None:
+            run('batch numpy', row_count, (len(batch['id'])
+                                           for batch in file.yield_csv_file_batch(file_path, output='numpy')))
+
+
+if __name__ == '__main__':
+    main()
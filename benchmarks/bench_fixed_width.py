@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Measure file.FixedWidthLayout write and read throughput against build_fixed_length and manual slicing
+# python3 benchmarks/bench_fixed_width.py [record_count]
+import os
+import sys
+import tempfile
+import time
+from helpers import file
+
+
+RECORD_LAYOUT = [{'name': f'field_{i}', 'length': 10, 'right_justify': i % 2 == 0} for i in range(20)]
+
+
+def main():
+    record_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    records = [{f'field_{i}': f'value{n % 1000}' for i in range(20)} for n in range(record_count)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.txt')
+
+        start_time = time.time()
+        with open(file_path, 'w') as fh:
+            for record in records:
+                fh.write(file.build_fixed_length(record, RECORD_LAYOUT) + '\n')
+        print(f"build_fixed_length: {record_count / (time.time() - start_time):,.0f} records/s")
+
+        start_time = time.time()
+        with open(file_path, 'w') as fh:
+            file.FixedWidthLayout(RECORD_LAYOUT).write_records(records, fh)
+        print(f"FixedWidthLayout.write_records: {record_count / (time.time() - start_time):,.0f} records/s")
+
+        file_mb = file.get_file_size(file_path) / 1024 / 1024
+
+        start_time = time.time()
+        with open(file_path, 'r') as fh:
+            for line in fh:
+                [line[i * 10:(i + 1) * 10].strip() for i in range(20)]
+        print(f"manual slicing: {file_mb / (time.time() - start_time):.1f} MB/s")
+
+        start_time = time.time()
+        for _ in file.yield_fixed_width_batch(file_path, RECORD_LAYOUT, output='columns'):
+            pass
+        print(f"yield_fixed_width_batch columns: {file_mb / (time.time() - start_time):.1f} MB/s")
+
+        start_time = time.time()
+        for _ in file.yield_fixed_width_batch(file_path, RECORD_LAYOUT):
+            pass
+        print(f"yield_fixed_width_batch rows: {file_mb / (time.time() - start_time):.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Compare single-threaded and block-parallel file.gzip_file
+# python3 benchmarks/bench_gzip.py [size_mb] [max_workers]
+import os
+import random
+import sys
+import tempfile
+import time
+from helpers import file
+
+
+def build_input_file(file_path, size_mb):
+    words = [b'alpha', b'beta', b'gamma', b'delta', b'2021-01-01', b'12345', b'67.89', b'"quoted"']
+
+    with open(file_path, 'wb') as fh:
+        while fh.tell() < size_mb * 1024 * 1024:
+            fh.write(b','.join(random.choice(words) for _ in range(12)) + b'\n')
+
+
+def run(file_path, **kwargs):
+    start_time = time.time()
+    output_path = file.gzip_file(file_path, **kwargs)
+    elapsed = time.time() - start_time
+    output_size = file.get_file_size(output_path)
+    file.delete_local_path(output_path)
+
+    return elapsed, output_size
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.csv')
+        build_input_file(file_path, size_mb)
+
+        elapsed, output_size = run(file_path)
+        print(f"single-threaded: {elapsed:.2f}s, {size_mb / elapsed:.1f} MB/s, output={output_size} bytes")
+
+        elapsed, output_size = run(file_path, max_workers=max_workers)
+        print(f"parallel ({max_workers} workers): {elapsed:.2f}s, {size_mb / elapsed:.1f} MB/s, "
+              f"output={output_size} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Time file.ungzip_file splitting a gzipped file into parts of max_lines_per_file lines
+# python3 benchmarks/bench_split.py [line_count] [max_lines_per_file ...]
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+from helpers import file
+
+
+def build_input_file(file_path, line_count):
+    words = [b'alpha', b'beta', b'gamma', b'delta', b'2021-01-01', b'12345', b'67.89', b'"quoted"']
+
+    with gzip.open(file_path, 'wb', compresslevel=1) as fh:
+        for _ in range(line_count):
+            fh.write(b','.join(random.choice(words) for _ in range(2)) + b'\n')
+
+
+def run(file_path, max_lines_per_file):
+    start_time = time.time()
+    output_paths = file.ungzip_file(file_path, max_lines_per_file=max_lines_per_file)
+    elapsed = time.time() - start_time
+
+    for output_path in output_paths:
+        file.delete_local_path(output_path)
+
+    return elapsed, len(output_paths)
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    max_lines_list = [int(arg) for arg in sys.argv[2:]] or [100000, 10000, 1000, 100]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.csv.gz')
+        build_input_file(file_path, line_count)
+
+        for max_lines_per_file in max_lines_list:
+            elapsed, file_count = run(file_path, max_lines_per_file)
+            print(f"max_lines_per_file={max_lines_per_file}: {elapsed:.2f}s, {file_count} files")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,29 @@
+import csv
+import heapq
+import io
+import itertools
+import logging
 import os
+import re
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+import simplejson as json
 from botocore.exceptions import ClientError
+from .. import file
 from .. import log
+from .. import metrics
+from .. import trace
+from .. import util
 from . import client, s3, glue
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 KB = 1024
 MB = KB * KB
@@ -15,13 +34,76 @@ COST_PER_BYTE = 5 / TB
 QUERY_COMPLETE_STATUS = ['SUCCEEDED', 'FAILED', 'CANCELLED']
 CONVERT_MAX_CONCURRENT = 10
 
+# QueryPoller settings, batch_get_query_execution accepts up to 50 query execution ids
+POLL_BATCH_SIZE = 50
+POLL_MIN_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 10
+POLL_BACKOFF_RATIO = 0.1
+POLL_MAX_ERRORS = 5
+THROTTLE_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException']
+
+# QueryScheduler settings, Athena's default quota is 20 active DML queries per account and region
+DEFAULT_WORKGROUP = 'primary'
+SCHEDULER_MAX_CONCURRENT = 20
+SCHEDULER_MAX_RETRIES = 5
+SCHEDULER_RETRY_DELAY = 1
+SCHEDULER_MAX_RETRY_DELAY = 30
+
+# yield_query_result_batches settings, other column types such as varchar, time, array, map and row are kept as strings
+RESULT_BATCH_SIZE = 10000
+RESULT_BATCH_OUTPUTS = ['rows', 'columns', 'numpy']
+RESULT_TYPE_CONVERTERS = {
+    'boolean': lambda value: value == 'true',
+    'tinyint': int,
+    'smallint': int,
+    'integer': int,
+    'bigint': int,
+    'float': float,
+    'real': float,
+    'double': float,
+    'decimal': Decimal,
+    'date': date.fromisoformat,
+    'timestamp': datetime.fromisoformat,
+}
+RESULT_NUMPY_TYPES = {
+    'boolean': 'bool',
+    'tinyint': 'int64',
+    'smallint': 'int64',
+    'integer': 'int64',
+    'bigint': 'int64',
+    'float': 'float64',
+    'real': 'float64',
+    'double': 'float64',
+    'date': 'datetime64[D]',
+    'timestamp': 'datetime64[ms]',
+}
+
+# QueryResultCache settings
+SQL_LITERAL_PATTERN = re.compile(r"('(?:[^']|'')*'|--[^\n]*|/\*.*?\*/)", re.DOTALL)
+SQL_PUNCTUATION_PATTERN = re.compile(r'\s*([(),=<>])\s*')
+SQL_TOKEN_PATTERN = re.compile(r'(?:"[^"]*"|[\w$]+)(?:\s*\.\s*(?:"[^"]*"|[\w$]+))*|\S')
+SQL_IDENTIFIER_PATTERN = re.compile(r'(?:"[^"]*"|[a-z_$][\w$]*)(?:\s*\.\s*(?:"[^"]*"|[\w$]+))*$')
+SQL_KEYWORDS = {'select', 'from', 'where', 'group', 'order', 'having', 'limit', 'offset', 'fetch', 'union',
+                'intersect', 'except', 'window', 'join', 'on', 'using', 'left', 'right', 'inner', 'full', 'outer',
+                'cross', 'natural', 'lateral', 'tablesample', 'for', 'with', 'values', 'unnest', 'as'}
+SQL_CLAUSE_END_KEYWORDS = {'where', 'group', 'order', 'having', 'limit', 'offset', 'fetch', 'union', 'intersect',
+                           'except', 'window'}
+SQL_CTE_PATTERN = re.compile(r'(?:\bwith|,)\s*"?([\w$]+)"?\s+as\s*\(')
+CACHED_QUERY_RESPONSE_KEYS = ['QueryExecutionId', 'Query', 'StatementType', 'ResultConfiguration',
+                              'QueryExecutionContext', 'Status', 'Statistics', 'WorkGroup']
+
+_query_poller = None
+_query_poller_lock = threading.Lock()
+
 
 def create_client():
     return client.create_client('athena')
 
 
 # submit query to Athena
-def start_query(database_name, query, query_result_location=None, workgroup=None, athena_client=None):
+@trace.traced
+def start_query(database_name, query, query_result_location=None, workgroup=None, result_reuse_max_age=None,
+                athena_client=None):
     if workgroup is None and query_result_location is None:
         raise ValueError("Missing output location. Must provide either query_result_location and/or workgroup. "
                          f"Database={database_name}, query={query}")
@@ -33,6 +115,12 @@ def start_query(database_name, query, query_result_location=None, workgroup=None
     if query_result_location is not None:
         kwargs['ResultConfiguration'] = {'OutputLocation': query_result_location}
 
+    # let Athena return the results of an identical query run in the last result_reuse_max_age minutes,
+    # requires Athena engine version 3
+    if result_reuse_max_age is not None:
+        kwargs['ResultReuseConfiguration'] = {'ResultReuseByAgeConfiguration': {
+            'Enabled': True, 'MaxAgeInMinutes': result_reuse_max_age}}
+
     if athena_client is None:
         athena_client = create_client()
 
@@ -43,6 +131,7 @@ def start_query(database_name, query, query_result_location=None, workgroup=None
     return resp['QueryExecutionId']
 
 
+@trace.traced
 def get_query_status(query_execution_id, athena_client=None):
     if athena_client is None:
         athena_client = create_client()
@@ -50,6 +139,7 @@ def get_query_status(query_execution_id, athena_client=None):
     return athena_client.get_query_execution(QueryExecutionId=query_execution_id)['QueryExecution']
 
 
+@trace.traced
 def batch_get_query_status(query_execution_id_list, athena_client=None):
     if athena_client is None:
         athena_client = create_client()
@@ -67,11 +157,17 @@ def _snooze(sleep_lag, total_sleep_time, sleep_lag_max=30, max_sleep_time=None,
                            f"running. Input queries={query_execution_id_list}")
 
     time.sleep(snooze_lag)
+    metrics.increment('athena.poll_sleep_seconds', snooze_lag)
 
     return snooze_lag
 
 
-def wait_for_query(query_execution_id, sleep_lag_max=30, max_sleep_time=None, athena_client=None):
+@trace.traced
+def wait_for_query(query_execution_id, sleep_lag_max=30, max_sleep_time=None, athena_client=None, poller=None):
+    # let the shared background poller check this query together with all other in-flight queries
+    if poller is not None:
+        return poller.wait(query_execution_id, timeout=max_sleep_time)
+
     if athena_client is None:
         athena_client = create_client()
 
@@ -91,11 +187,12 @@ def wait_for_query(query_execution_id, sleep_lag_max=30, max_sleep_time=None, at
                                 query_execution_id_list=[query_execution_id])
             total_sleep_time += sleep_lag
 
-    log.get_logger().info(f"Query {query_execution_id} is done. Slept for {total_sleep_time} seconds.")
+    log.get_logger().info("Query %s is done. Slept for %s seconds.", query_execution_id, total_sleep_time)
 
     return resp
 
 
+@trace.traced
 def batch_wait_for_queries(query_execution_id_list, sleep_lag_max=30, max_sleep_time=None, athena_client=None):
     if athena_client is None:
         athena_client = create_client()
@@ -135,67 +232,392 @@ def batch_wait_for_queries(query_execution_id_list, sleep_lag_max=30, max_sleep_
     return batch_resp
 
 
-def yield_query_results(query_execution_id, max_results=None, delete_output=False, athena_client=None):
+# Returns the QueryPoller shared by all threads of the process
+def get_query_poller():
+    global _query_poller
+
+    with _query_poller_lock:
+        if _query_poller is None:
+            _query_poller = QueryPoller()
+
+    return _query_poller
+
+
+# Tracks every in-flight query execution in one background thread that checks the due queries with
+# batch_get_query_execution in chunks of 50, instead of one polling loop per waiting thread.
+# Queries are polled often while young and less often as they run longer, so a query waits about
+# POLL_BACKOFF_RATIO of its runtime past completion.  With expected_runtime, the first polls are
+# skipped until the query is expected to be done.  The thread exits when no queries are pending.
+class QueryPoller(object):
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL, batch_size=POLL_BATCH_SIZE,
+                 athena_client=None):
+        if athena_client is None:
+            athena_client = create_client()
+
+        self.athena_client = athena_client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    # Returns a Future resolved with the get_query_execution response once the query is complete,
+    # queries that Athena could not process resolve with a FAILED status.
+    # Waiters of the same query share one Future, the query is polled until the last waiter timed out.
+    def submit(self, query_execution_id, expected_runtime=None):
+        with self.condition:
+            pending_query = self.pending.get(query_execution_id)
+            if pending_query is None:
+                start_time = time.monotonic()
+                pending_query = self.pending[query_execution_id] = {
+                    'future': Future(),
+                    'start_time': start_time,
+                    'expected_runtime': expected_runtime,
+                    'next_poll_time': start_time + self._get_poll_interval(0, expected_runtime),
+                    'waiter_count': 0,
+                    'error_count': 0,
+                }
+            pending_query['waiter_count'] += 1
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='athena-query-poller', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+        return pending_query['future']
+
+    def wait(self, query_execution_id, timeout=None, expected_runtime=None):
+        future = self.submit(query_execution_id, expected_runtime=expected_runtime)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self.condition:
+                pending_query = self.pending.get(query_execution_id)
+                if pending_query is not None and pending_query['future'] is future:
+                    pending_query['waiter_count'] -= 1
+                    if pending_query['waiter_count'] <= 0:
+                        del self.pending[query_execution_id]
+
+            raise TimeoutError(f"Timed out! Waited {timeout} seconds for query to complete, but it is still "
+                               f"running. Input queries={[query_execution_id]}")
+
+    def get_pending_count(self):
+        return len(self.pending)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    return
+
+                now = time.monotonic()
+                next_poll_time = min(pending_query['next_poll_time'] for pending_query in self.pending.values())
+                if next_poll_time > now:
+                    self.condition.wait(next_poll_time - now)
+                    continue
+
+                # fill up the batches with queries that are due soon, they are checked without extra calls
+                poll_list = sorted((pending_query['next_poll_time'], query_execution_id)
+                                   for query_execution_id, pending_query in self.pending.items()
+                                   if pending_query['next_poll_time'] <= now + self.min_interval)
+                due_count = len([poll_time for poll_time, _ in poll_list if poll_time <= now])
+                batch_count = -(-due_count // self.batch_size)
+                poll_id_list = [query_execution_id for _, query_execution_id
+                                in poll_list[:batch_count * self.batch_size]]
+
+            for idx in range(0, len(poll_id_list), self.batch_size):
+                self._poll(poll_id_list[idx:idx + self.batch_size])
+
+    # Errors of a batch call, e.g. a dropped connection, are retried at the next interval and only fail the
+    # queries of the batch after POLL_MAX_ERRORS consecutive errors, throttled calls are always retried
+    def _poll(self, query_execution_id_list):
+        completed = {}
+        error = None
+
+        try:
+            batch_resp = batch_get_query_status(query_execution_id_list, athena_client=self.athena_client)
+
+            for resp in batch_resp.get('QueryExecutions', []):
+                if resp.get('Status', {}).get('State') in QUERY_COMPLETE_STATUS:
+                    completed[resp['QueryExecutionId']] = resp
+
+            for error_resp in batch_resp.get('UnprocessedQueryExecutionIds', []):
+                if 'Status' not in error_resp:
+                    error_resp['Status'] = {'State': 'FAILED'}
+                completed[error_resp['QueryExecutionId']] = error_resp
+        except Exception as e:
+            error = e
+
+        throttled = isinstance(error, ClientError) and error.response['Error']['Code'] in THROTTLE_ERROR_CODES
+        if error is not None and not throttled:
+            log.log_rate_limited(log.get_logger(), logging.WARNING, "Failed to check %s queries, will retry: %s",
+                                 len(query_execution_id_list), error, key='athena.QueryPoller._poll')
+
+        finished = []
+        with self.condition:
+            now = time.monotonic()
+            for query_execution_id in query_execution_id_list:
+                pending_query = self.pending.get(query_execution_id)
+                if pending_query is None:
+                    continue
+
+                if error is not None and not throttled:
+                    pending_query['error_count'] += 1
+                elif error is None:
+                    pending_query['error_count'] = 0
+
+                if query_execution_id in completed or pending_query['error_count'] >= POLL_MAX_ERRORS:
+                    del self.pending[query_execution_id]
+                    finished.append((pending_query['future'], completed.get(query_execution_id)))
+                else:
+                    pending_query['next_poll_time'] = now + self._get_poll_interval(now - pending_query['start_time'],
+                                                                                    pending_query['expected_runtime'])
+
+        for future, resp in finished:
+            if resp is None:
+                future.set_exception(error)
+            else:
+                future.set_result(resp)
+
+    def _get_poll_interval(self, elapsed_time, expected_runtime=None):
+        interval = elapsed_time * POLL_BACKOFF_RATIO
+        if expected_runtime is not None and elapsed_time < expected_runtime:
+            interval = max(interval, expected_runtime - elapsed_time)
+
+        return min(max(interval, self.min_interval), self.max_interval)
+
+
+# Yields query result rows as dictionaries of column name to value.
+# stream_output=True reads the CSV result file from the query's output location on S3, optionally with
+# max_workers parallel ranged GETs, instead of paging through GetQueryResults 1000 rows per call.
+# Null and empty string values are both None in the CSV file.  Only DML queries write CSV result files,
+# results of other statements, e.g. show partitions, are always read with GetQueryResults.
+# With GetQueryResults, prefetch_pages pages are fetched in a background thread while rows are consumed.
+def yield_query_results(query_execution_id, max_results=None, delete_output=False, athena_client=None,
+                        stream_output=False, max_workers=None, prefetch_pages=0):
     if athena_client is None:
         athena_client = create_client()
 
+    query_resp = get_query_status(query_execution_id, athena_client=athena_client) if stream_output else None
+
+    if query_resp is not None and query_resp.get('StatementType') == 'DML':
+        rows = _yield_output_file_rows(query_resp['ResultConfiguration']['OutputLocation'], max_workers)
+    else:
+        rows = _yield_result_page_rows(query_execution_id, max_results, athena_client, prefetch_pages)
+
+    try:
+        yield from itertools.islice(rows, max_results)
+    finally:
+        rows.close()
+
+    # delete output file of athena query
+    if delete_output:
+        if query_resp is None:
+            query_resp = get_query_status(query_execution_id, athena_client=athena_client)
+        s3.delete_uri(query_resp['ResultConfiguration']['OutputLocation'])
+
+
+def _yield_result_page_rows(query_execution_id, max_results, athena_client, prefetch_pages=0):
+    pages = _yield_result_pages(query_execution_id, max_results, athena_client)
+    if prefetch_pages:
+        pages = util.prefetch(pages, buffer_size=prefetch_pages)
+
+    try:
+        for column_info, value_rows in pages:
+            headers = [column['Name'] for column in column_info]
+            for values in value_rows:
+                yield dict(zip(headers, values))
+    finally:
+        pages.close()
+
+
+# Yields (ColumnInfo, list of value lists) per GetQueryResults page, null values are None
+def _yield_result_pages(query_execution_id, max_results, athena_client):
     kwargs = {}
     if max_results is not None:
         # add 1 for header row, it is counted as a row in the result set
         kwargs['PaginationConfig'] = {'MaxItems': max_results+1}
 
-    headers = None
+    first_row = True
 
     paginator = athena_client.get_paginator('get_query_results')
     page_iterator = paginator.paginate(QueryExecutionId=query_execution_id, **kwargs)
 
     for page in page_iterator:
-        if headers is None:
-            headers = [h['Name'] for h in page['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-
-        for result_row in page['ResultSet']['Rows']:
-            # ignore header row
-            if result_row['Data'][0]['VarCharValue'] != headers[0]:
-                yield {
-                    headers[idx]: val.get('VarCharValue')
-                    for idx, val in enumerate(result_row['Data'])
-                }
+        column_info = page['ResultSet']['ResultSetMetadata']['ColumnInfo']
+        value_rows = [[val.get('VarCharValue') for val in result_row['Data']]
+                      for result_row in page['ResultSet']['Rows']]
+
+        # only the first row can be the header row, results of DDL statements have none
+        if first_row and value_rows:
+            first_row = False
+            if value_rows[0] == [column['Name'] for column in column_info]:
+                value_rows = value_rows[1:]
+
+        yield column_info, value_rows
+
+
+def _yield_output_file_rows(output_location, max_workers=None):
+    bucket, key = s3.parse_bucket_and_prefix_from_uri(output_location)
+
+    with io.TextIOWrapper(s3.open_file_stream(bucket, key, max_workers=max_workers), encoding='utf-8',
+                          newline='') as fh:
+        yield from file.yield_csv_stream_row(fh, stream_name=output_location)
+
+
+# Same as yield_query_results, but yields batches of up to batch_size rows with values converted once per column
+# based on ResultSetMetadata.ColumnInfo: boolean to bool, integer types to int, floating point types to float,
+# decimal to Decimal, date to date and timestamp to datetime, other types are kept as strings.
+# output='rows' yields a list of tuples in ColumnInfo order,
+# output='columns' yields a dictionary of column name to list of values and
+# output='numpy' yields a dictionary of column name to NumPy array, typed for converted columns (object for
+# boolean and integer columns with nulls, nan and NaT for null floats, dates and timestamps).
+def yield_query_result_batches(query_execution_id, batch_size=RESULT_BATCH_SIZE, output='rows', max_results=None,
+                               delete_output=False, athena_client=None, stream_output=False, max_workers=None,
+                               prefetch_pages=0):
+    if output not in RESULT_BATCH_OUTPUTS:
+        raise ValueError(f"Unsupported output {output}.  Supported values are: {RESULT_BATCH_OUTPUTS}")
+    if output == 'numpy' and np is None:
+        raise ImportError("numpy is required for output='numpy'")
+
+    if athena_client is None:
+        athena_client = create_client()
+
+    query_resp = get_query_status(query_execution_id, athena_client=athena_client) if stream_output else None
+    empty_as_null = query_resp is not None and query_resp.get('StatementType') == 'DML'
+
+    if empty_as_null:
+        # the CSV result file has no column types
+        column_info = athena_client.get_query_results(QueryExecutionId=query_execution_id, MaxResults=1)[
+            'ResultSet']['ResultSetMetadata']['ColumnInfo']
+        pages = _yield_output_file_pages(query_resp['ResultConfiguration']['OutputLocation'], column_info,
+                                         batch_size, max_workers)
+    else:
+        pages = _yield_result_pages(query_execution_id, max_results, athena_client)
+
+    if prefetch_pages:
+        pages = util.prefetch(pages, buffer_size=prefetch_pages)
+
+    try:
+        first_page = next(pages, None)
+        if first_page is not None:
+            column_info = first_page[0]
+            column_names = [column['Name'] for column in column_info]
+            column_types = [column['Type'].lower() for column in column_info]
+            converters = [RESULT_TYPE_CONVERTERS.get(column_type) for column_type in column_types]
+            numpy_types = [RESULT_NUMPY_TYPES.get(column_type) for column_type in column_types]
+
+            value_rows = itertools.islice(itertools.chain(first_page[1], (values for _, page_rows in pages
+                                                                           for values in page_rows)), max_results)
+            while True:
+                batch = list(itertools.islice(value_rows, batch_size))
+                if not batch:
+                    break
+
+                yield _build_result_batch(batch, column_names, converters, numpy_types, output, empty_as_null)
+    finally:
+        pages.close()
 
     # delete output file of athena query
     if delete_output:
-        query_resp = get_query_status(query_execution_id, athena_client=athena_client)
+        if query_resp is None:
+            query_resp = get_query_status(query_execution_id, athena_client=athena_client)
         s3.delete_uri(query_resp['ResultConfiguration']['OutputLocation'])
 
 
-def get_query_results(query_execution_id, max_results=None, athena_client=None, delete_output=None):
+# Yields (ColumnInfo, list of value lists) per page_size rows of the CSV result file, empty values are ''
+def _yield_output_file_pages(output_location, column_info, page_size, max_workers=None):
+    bucket, key = s3.parse_bucket_and_prefix_from_uri(output_location)
+
+    with io.TextIOWrapper(s3.open_file_stream(bucket, key, max_workers=max_workers), encoding='utf-8',
+                          newline='') as fh:
+        csv_reader = csv.reader(fh)
+        # skip header row
+        next(csv_reader, None)
+
+        while True:
+            value_rows = list(itertools.islice(csv_reader, page_size))
+            if not value_rows:
+                break
+
+            yield column_info, value_rows
+
+
+def _build_result_batch(batch, column_names, converters, numpy_types, output, empty_as_null=False):
+    columns = []
+    for column_values, converter in zip(zip(*batch), converters):
+        if converter is not None:
+            # null values are None, or '' in CSV result files
+            columns.append([converter(value) if value else None for value in column_values])
+        elif empty_as_null and '' in column_values:
+            columns.append([None if value == '' else value for value in column_values])
+        else:
+            columns.append(list(column_values))
+
+    if output == 'rows':
+        return list(zip(*columns))
+
+    if output == 'columns':
+        return dict(zip(column_names, columns))
+
+    column_batch = {}
+    for column_name, column_values, numpy_type in zip(column_names, columns, numpy_types):
+        if numpy_type is None or (numpy_type in ('bool', 'int64') and None in column_values):
+            column_batch[column_name] = np.array(column_values, dtype=object)
+        else:
+            column_batch[column_name] = np.array(column_values, dtype=numpy_type)
+
+    return column_batch
+
+
+@trace.traced
+def get_query_results(query_execution_id, max_results=None, athena_client=None, delete_output=None,
+                      stream_output=False, max_workers=None, prefetch_pages=0):
     return [row for row in yield_query_results(query_execution_id, max_results=max_results,
-                                               athena_client=athena_client, delete_output=delete_output)]
+                                               athena_client=athena_client, delete_output=delete_output,
+                                               stream_output=stream_output, max_workers=max_workers,
+                                               prefetch_pages=prefetch_pages)]
 
 
 # execute and wait for query
+@trace.traced
 def run_query(database_name, query, query_result_location=None, delete_output=False, workgroup=None,
-              athena_client=None):
-    logger = log.get_logger()
+              athena_client=None, poller=None, scheduler=None, result_reuse_max_age=None):
+    # queue the query behind the scheduler's workgroup limits
+    if scheduler is not None:
+        return scheduler.submit(database_name, query,
+                                query_result_location=query_result_location,
+                                delete_output=delete_output,
+                                workgroup=workgroup,
+                                result_reuse_max_age=result_reuse_max_age).result()
 
     query_execution_id = start_query(database_name, query,
                                      query_result_location=query_result_location,
                                      workgroup=workgroup,
+                                     result_reuse_max_age=result_reuse_max_age,
                                      athena_client=athena_client)
 
-    # handle error status
-    query_resp = wait_for_query(query_execution_id, athena_client=athena_client)
+    query_resp = wait_for_query(query_execution_id, athena_client=athena_client, poller=poller)
+
+    return _check_query_response(database_name, query_resp, delete_output=delete_output)
+
 
+# log, delete output of and handle error status of a completed query
+def _check_query_response(database_name, query_resp, delete_output=False):
     status = query_resp['Status']['State']
-    statistics = query_resp['Statistics']
+    statistics = query_resp.get('Statistics', {})
+    data_scanned = statistics.get('DataScannedInBytes', 0)
 
-    logger.info("{}: query_execution_id={}, status={}, Run time={}, scanned bytes={}, cost=${}"
-                . format(database_name, query_execution_id, status,
-                         statistics['EngineExecutionTimeInMillis'],
-                         statistics['DataScannedInBytes'],
-                         statistics['DataScannedInBytes'] * COST_PER_BYTE))
+    log.get_logger().info("%s: query_execution_id=%s, status=%s, Run time=%s, scanned bytes=%s, cost=$%s",
+                          database_name, query_resp['QueryExecutionId'], status,
+                          statistics.get('EngineExecutionTimeInMillis'),
+                          data_scanned,
+                          data_scanned * COST_PER_BYTE)
 
     # delete output file of athena query
-    if delete_output:
+    if delete_output and 'ResultConfiguration' in query_resp:
         s3.delete_uri(query_resp['ResultConfiguration']['OutputLocation'])
 
     if status != 'SUCCEEDED':
@@ -204,6 +626,455 @@ def run_query(database_name, query, query_result_location=None, delete_output=Fa
     return query_resp
 
 
+# Queues submitted queries and starts them in priority order (highest first, then in submit order) while keeping
+# at most max_concurrent queries in flight per workgroup, so many callers sharing a workgroup do not trip Athena's
+# concurrent query quota.  Throttled start_query_execution calls are retried with exponential backoff.
+# Started queries are waited for by the poller and the returned futures resolve like run_query.
+# Reports athena.scheduler.queue_depth, athena.scheduler.wait_time (seconds queued) and
+# athena.scheduler.slot_utilization (share of the workgroup limit in use) histograms tagged with workgroup.
+class QueryScheduler(object):
+    def __init__(self, max_concurrent=SCHEDULER_MAX_CONCURRENT, workgroup_limits=None,
+                 max_retries=SCHEDULER_MAX_RETRIES, retry_delay=SCHEDULER_RETRY_DELAY, poller=None, athena_client=None):
+        if athena_client is None:
+            athena_client = create_client()
+
+        if poller is None:
+            poller = get_query_poller()
+
+        self.athena_client = athena_client
+        self.poller = poller
+        self.max_concurrent = max_concurrent
+        self.workgroup_limits = workgroup_limits if workgroup_limits is not None else {}
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue = []
+        self.sequence = itertools.count()
+        self.in_flight = {}
+        self.completed = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, database_name, query, query_result_location=None, delete_output=False, workgroup=None,
+               priority=0, result_reuse_max_age=None):
+        scheduled_query = {
+            'future': Future(),
+            'database_name': database_name,
+            'query': query,
+            'query_result_location': query_result_location,
+            'delete_output': delete_output,
+            'workgroup': workgroup,
+            'result_reuse_max_age': result_reuse_max_age,
+            'priority': priority,
+            'submit_time': time.monotonic(),
+            'start_time': 0,
+            'retry_count': 0,
+        }
+
+        with self.condition:
+            self._push(scheduled_query)
+            metrics.observe('athena.scheduler.queue_depth', len(self.queue),
+                            {'workgroup': self._get_workgroup(workgroup)})
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='athena-query-scheduler', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+        return scheduled_query['future']
+
+    def get_limit(self, workgroup):
+        return self.workgroup_limits.get(self._get_workgroup(workgroup), self.max_concurrent)
+
+    # Returns number of queued queries and number of queries in flight per workgroup
+    def get_stats(self):
+        with self.condition:
+            return {'queued': len(self.queue),
+                    'in_flight': {workgroup: count for workgroup, count in self.in_flight.items() if count}}
+
+    def _push(self, scheduled_query):
+        heapq.heappush(self.queue, (-scheduled_query['priority'], next(self.sequence), scheduled_query))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                completed, self.completed = self.completed, []
+
+            # deleting output files is done here to keep the poller thread free
+            for scheduled_query, poll_future in completed:
+                self._finish(scheduled_query, poll_future)
+
+            with self.condition:
+                if self.completed:
+                    continue
+
+                if not self.queue and not any(self.in_flight.values()):
+                    self.thread = None
+                    return
+
+                start_list, wait_time = self._reserve_slots(time.monotonic())
+                if not start_list:
+                    self.condition.wait(wait_time)
+                    continue
+
+            for scheduled_query in start_list:
+                self._start(scheduled_query)
+
+    # Pops queries that can start now and takes their workgroup slots.  Returns them with the time until
+    # the next throttled query may be retried, None when only waiting for slots.
+    def _reserve_slots(self, now):
+        start_list = []
+        deferred = []
+        wait_time = None
+
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            scheduled_query = entry[2]
+            workgroup = self._get_workgroup(scheduled_query['workgroup'])
+
+            if scheduled_query['start_time'] > now:
+                deferred.append(entry)
+                retry_wait_time = scheduled_query['start_time'] - now
+                wait_time = retry_wait_time if wait_time is None else min(wait_time, retry_wait_time)
+            elif self.in_flight.get(workgroup, 0) >= self.get_limit(workgroup):
+                deferred.append(entry)
+            else:
+                self.in_flight[workgroup] = self.in_flight.get(workgroup, 0) + 1
+                start_list.append(scheduled_query)
+                metrics.observe('athena.scheduler.slot_utilization',
+                                self.in_flight[workgroup] / self.get_limit(workgroup), {'workgroup': workgroup})
+
+        for entry in deferred:
+            heapq.heappush(self.queue, entry)
+
+        return start_list, wait_time
+
+    def _start(self, scheduled_query):
+        workgroup = self._get_workgroup(scheduled_query['workgroup'])
+
+        try:
+            query_execution_id = start_query(scheduled_query['database_name'], scheduled_query['query'],
+                                             query_result_location=scheduled_query['query_result_location'],
+                                             workgroup=scheduled_query['workgroup'],
+                                             result_reuse_max_age=scheduled_query['result_reuse_max_age'],
+                                             athena_client=self.athena_client)
+        except Exception as e:
+            throttled = isinstance(e, ClientError) and e.response['Error']['Code'] in THROTTLE_ERROR_CODES
+
+            with self.condition:
+                self.in_flight[workgroup] -= 1
+
+                if throttled and scheduled_query['retry_count'] < self.max_retries:
+                    metrics.increment('athena.scheduler.throttled', 1, {'workgroup': workgroup})
+                    retry_delay = min(self.retry_delay * 2 ** scheduled_query['retry_count'],
+                                      SCHEDULER_MAX_RETRY_DELAY)
+                    scheduled_query['retry_count'] += 1
+                    scheduled_query['start_time'] = time.monotonic() + retry_delay
+                    self._push(scheduled_query)
+                    return
+
+            scheduled_query['future'].set_exception(e)
+            return
+
+        metrics.observe('athena.scheduler.wait_time', time.monotonic() - scheduled_query['submit_time'],
+                        {'workgroup': workgroup})
+
+        poll_future = self.poller.submit(query_execution_id)
+        poll_future.add_done_callback(lambda future: self._on_complete(scheduled_query, future))
+
+    # called by the poller thread, frees the slot and hands the response to the scheduler thread
+    def _on_complete(self, scheduled_query, poll_future):
+        with self.condition:
+            self.in_flight[self._get_workgroup(scheduled_query['workgroup'])] -= 1
+            self.completed.append((scheduled_query, poll_future))
+            self.condition.notify()
+
+    def _finish(self, scheduled_query, poll_future):
+        try:
+            query_resp = _check_query_response(scheduled_query['database_name'], poll_future.result(),
+                                               delete_output=scheduled_query['delete_output'])
+        except Exception as e:
+            scheduled_query['future'].set_exception(e)
+        else:
+            scheduled_query['future'].set_result(query_resp)
+
+    @staticmethod
+    def _get_workgroup(workgroup):
+        return workgroup if workgroup is not None else DEFAULT_WORKGROUP
+
+
+# Returns query text with comments removed, whitespace collapsed and everything but string literals lower-cased,
+# so formatting changes of the same query share a QueryResultCache entry
+def normalize_query(query):
+    parts = []
+    code_parts = []
+    for idx, part in enumerate(SQL_LITERAL_PATTERN.split(query)):
+        if idx % 2 == 0:
+            code_parts.append(part)
+        elif part.startswith("'"):
+            # string literals are kept unchanged
+            parts.append(_normalize_sql_code(''.join(code_parts)))
+            parts.append(part)
+            code_parts = []
+        else:
+            # comment
+            code_parts.append(' ')
+
+    parts.append(_normalize_sql_code(''.join(code_parts)).rstrip(';').rstrip())
+
+    return ''.join(parts)
+
+
+def _normalize_sql_code(code):
+    return SQL_PUNCTUATION_PATTERN.sub(r'\1', ' '.join(code.split()).lower())
+
+
+# Returns sorted list of (database name, table name) read by the query, tables without database are in database_name.
+# Comma separated from lists, joins and subqueries are parsed, common table expressions and unnest are excluded.
+# Views are returned as tables, the tables they read are not.  Returns None if the from clauses cannot be parsed,
+# e.g. table functions or parenthesized joins, so callers do not treat unknown tables as unchanged.
+def get_query_tables(query, database_name):
+    code = ' ? '.join(part for idx, part in enumerate(SQL_LITERAL_PATTERN.split(normalize_query(query)))
+                      if idx % 2 == 0)
+    cte_names = set(SQL_CTE_PATTERN.findall(code))
+    tokens = SQL_TOKEN_PATTERN.findall(code)
+
+    query_tables = set()
+    for idx, keyword in enumerate(tokens):
+        if keyword == 'join':
+            item_indexes = [idx + 1]
+        elif keyword == 'from':
+            item_indexes = [idx + 1] + _get_sql_from_list_indexes(tokens, idx + 1)
+        else:
+            continue
+
+        for item_idx in item_indexes:
+            token = tokens[item_idx] if item_idx < len(tokens) else None
+            next_token = tokens[item_idx + 1] if item_idx + 1 < len(tokens) else None
+
+            if token == '(' and next_token in ('select', 'with', 'values'):
+                # subquery, its from clauses are parsed by the outer loop
+                continue
+            if token == 'unnest' and next_token == '(':
+                continue
+            if token is None or next_token == '(' or not SQL_IDENTIFIER_PATTERN.match(token) or token in SQL_KEYWORDS:
+                # table function, parenthesized join or other syntax that is not parsed
+                return None
+
+            table_name = [name.strip().strip('"') for name in token.split('.')]
+            if len(table_name) > 1:
+                query_tables.add(tuple(table_name[-2:]))
+            elif table_name[0] not in cte_names:
+                query_tables.add((database_name, table_name[0]))
+
+    return sorted(query_tables)
+
+
+# Returns indexes of the from list items after the first one, i.e. the tokens after top level commas
+# until the end of the from clause
+def _get_sql_from_list_indexes(tokens, idx):
+    item_indexes = []
+    depth = 0
+    for idx in range(idx, len(tokens)):
+        token = tokens[idx]
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+            if depth < 0:
+                break
+        elif depth == 0 and (token in SQL_CLAUSE_END_KEYWORDS or token == ';'):
+            break
+        elif depth == 0 and token == ',':
+            item_indexes.append(idx + 1)
+
+    return item_indexes
+
+
+# Caches query executions by normalized query text, database and workgroup, e.g. for dashboards that run the same
+# query many times a day.  An entry is used while the Glue UpdateTime of every table read by the query is unchanged,
+# with partition_fingerprint also while the partitions of the tables are unchanged, and for at most max_age seconds.
+# Adding files to an existing location does not change UpdateTime, max_age limits how stale such results get.
+# Queries whose tables get_query_tables cannot parse are run without the cache unless tables are given.
+# Entries are kept in memory, as JSON files in cache_path or as JSON objects under cache_s3_uri.  Results are read
+# from the output location of the cached query, or from a local copy in cache_path with copy_results.
+class QueryResultCache(object):
+    def __init__(self, cache_path=None, cache_s3_uri=None, max_age=None, partition_fingerprint=False,
+                 copy_results=False, glue_client=None, athena_client=None):
+        if copy_results and cache_path is None:
+            raise ValueError("Missing cache_path. Results can only be copied to a local cache_path.")
+
+        if athena_client is None:
+            athena_client = create_client()
+
+        if glue_client is None:
+            glue_client = glue.create_client()
+
+        self.cache_path = cache_path
+        self.cache_s3_uri = cache_s3_uri
+        self.max_age = max_age
+        self.partition_fingerprint = partition_fingerprint
+        self.copy_results = copy_results
+        self.glue_client = glue_client
+        self.athena_client = athena_client
+        self.entries = {}
+
+        if cache_path is not None:
+            file.ensure_local_path_exists(cache_path)
+
+    def get_cache_key(self, database_name, query, workgroup=None):
+        return util.get_md5sum_dict({'database_name': database_name, 'query': normalize_query(query),
+                                     'workgroup': workgroup})
+
+    # Returns dictionary of table name to Glue UpdateTime (and partition fingerprint) of the tables read by the query,
+    # None if the tables of the query are not known
+    def get_source_version(self, database_name, query, tables=None):
+        if tables is None:
+            tables = get_query_tables(query, database_name)
+            if tables is None:
+                return None
+
+        source_version = {}
+        for table_database_name, table_name in tables:
+            table = glue.get_table(table_database_name, table_name, glue_client=self.glue_client)
+            version = str(table['Table'].get('UpdateTime')) if table is not None else None
+
+            if self.partition_fingerprint and table is not None and table['Table'].get('PartitionKeys'):
+                partitions = sorted([partition['Values'], partition['Location']] for partition in
+                                    glue.yield_partitions(table_database_name, table_name,
+                                                          glue_client=self.glue_client))
+                version = f"{version}/{util.get_md5sum_dict(partitions)}"
+
+            source_version[f"{table_database_name}.{table_name}"] = version
+
+        return source_version
+
+    # Returns the cached query response, None if there is no valid entry
+    def get(self, database_name, query, workgroup=None, tables=None, source_version=None):
+        cache_key = self.get_cache_key(database_name, query, workgroup)
+        entry = self._read_entry(cache_key)
+        if entry is None:
+            return None
+
+        if self.max_age is not None and time.time() - entry['created_time'] > self.max_age:
+            return None
+
+        if source_version is None:
+            source_version = self.get_source_version(database_name, query, tables)
+        if source_version is None or entry['source_version'] != source_version:
+            return None
+
+        local_result_file = self._get_local_result_file(cache_key)
+        if local_result_file is not None and os.path.isfile(local_result_file):
+            return entry['query_resp']
+
+        # results are gone, e.g. deleted by a lifecycle rule
+        if not s3.uri_exists(entry['output_location']):
+            return None
+
+        return entry['query_resp']
+
+    # Caches a completed query, source_version should be taken before the query was started.
+    # Queries with unknown tables are not cached.
+    def put(self, database_name, query, query_resp, workgroup=None, tables=None, source_version=None):
+        if source_version is None:
+            source_version = self.get_source_version(database_name, query, tables)
+            if source_version is None:
+                return
+
+        cache_key = self.get_cache_key(database_name, query, workgroup)
+        output_location = query_resp['ResultConfiguration']['OutputLocation']
+
+        if self.copy_results and query_resp.get('StatementType') == 'DML':
+            bucket, key = s3.parse_bucket_and_prefix_from_uri(output_location)
+            s3.create_client().download_file(bucket, key, self._get_local_result_file(cache_key))
+
+        self._write_entry(cache_key, {
+            'database_name': database_name,
+            'workgroup': workgroup,
+            'query': normalize_query(query),
+            'source_version': source_version,
+            'created_time': time.time(),
+            'output_location': output_location,
+            'query_resp': {key: query_resp[key] for key in CACHED_QUERY_RESPONSE_KEYS if key in query_resp},
+        })
+
+    # Same as run_query, but returns the cached query response if there is a valid entry
+    def run_query(self, database_name, query, query_result_location=None, workgroup=None, tables=None,
+                  result_reuse_max_age=None, poller=None, scheduler=None):
+        source_version = self.get_source_version(database_name, query, tables)
+
+        query_resp = self.get(database_name, query, workgroup=workgroup, source_version=source_version) \
+            if source_version is not None else None
+        if query_resp is not None:
+            metrics.increment('athena.result_cache.hits')
+            log.get_logger().info("%s: using cached query_execution_id=%s", database_name,
+                                  query_resp['QueryExecutionId'])
+            return query_resp
+
+        metrics.increment('athena.result_cache.misses' if source_version is not None else 'athena.result_cache.skipped')
+        query_resp = run_query(database_name, query,
+                               query_result_location=query_result_location,
+                               workgroup=workgroup,
+                               result_reuse_max_age=result_reuse_max_age,
+                               athena_client=self.athena_client,
+                               poller=poller,
+                               scheduler=scheduler)
+
+        if source_version is not None:
+            self.put(database_name, query, query_resp, workgroup=workgroup, source_version=source_version)
+
+        return query_resp
+
+    # Runs the query with run_query and yields result rows, from the local copy when available
+    def yield_query_results(self, database_name, query, query_result_location=None, workgroup=None, tables=None,
+                            max_results=None, stream_output=True, max_workers=None):
+        query_resp = self.run_query(database_name, query, query_result_location=query_result_location,
+                                    workgroup=workgroup, tables=tables)
+
+        local_result_file = self._get_local_result_file(self.get_cache_key(database_name, query, workgroup))
+        if local_result_file is not None and os.path.isfile(local_result_file):
+            yield from itertools.islice(file.yield_csv_file_row(local_result_file), max_results)
+            return
+
+        yield from yield_query_results(query_resp['QueryExecutionId'], max_results=max_results,
+                                       athena_client=self.athena_client, stream_output=stream_output,
+                                       max_workers=max_workers)
+
+    def _get_local_result_file(self, cache_key):
+        return os.path.join(self.cache_path, f"{cache_key}.csv") if self.copy_results else None
+
+    def _read_entry(self, cache_key):
+        if self.cache_path is not None:
+            entry_file = os.path.join(self.cache_path, f"{cache_key}.json")
+            if not os.path.isfile(entry_file):
+                return None
+
+            with open(entry_file) as fh:
+                return json.load(fh)
+
+        if self.cache_s3_uri is not None:
+            bucket, prefix = s3.parse_bucket_and_prefix_from_uri(os.path.join(self.cache_s3_uri, f"{cache_key}.json"))
+            try:
+                return json.loads(s3.create_client().get_object(Bucket=bucket, Key=prefix)['Body'].read())
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                    return None
+                raise e
+
+        return self.entries.get(cache_key)
+
+    def _write_entry(self, cache_key, entry):
+        if self.cache_path is not None:
+            with open(os.path.join(self.cache_path, f"{cache_key}.json"), 'w') as fh:
+                json.dump(entry, fh, default=str)
+        elif self.cache_s3_uri is not None:
+            bucket, prefix = s3.parse_bucket_and_prefix_from_uri(os.path.join(self.cache_s3_uri, f"{cache_key}.json"))
+            s3.write_file(bucket, prefix, json.dumps(entry, default=str))
+        else:
+            self.entries[cache_key] = entry
+
+
+@trace.traced
 def get_partitions(database_name, table_name, query_result_location, workgroup=None, athena_client=None):
     if athena_client is None:
         athena_client = create_client()
@@ -220,6 +1091,7 @@ def get_partitions(database_name, table_name, query_result_location, workgroup=N
     return [value for partition in query_results for value in partition.values()]
 
 
+@trace.traced
 def refresh_partitions(database_name, table_name, query_result_location=None, workgroup=None):
     query = f"msck repair table {database_name}.{table_name}"
     return run_query(database_name, query,
@@ -228,9 +1100,10 @@ def refresh_partitions(database_name, table_name, query_result_location=None, wo
                      workgroup=workgroup)
 
 
+@trace.traced
 def run_ctas_query(source_database_name, source_table_name, target_database_name, target_table_name,
                    external_location, data_format, partition_columns=None, bucket_columns=None, bucket_count=None,
-                   query_result_location=None, workgroup=None):
+                   query_result_location=None, workgroup=None, poller=None, scheduler=None):
     ctas_column_list = _build_ctas_columns(source_database_name, source_table_name, partition_columns)
     with_statement = _build_ctas_with(data_format, external_location, partition_columns, bucket_columns, bucket_count)
 
@@ -242,7 +1115,9 @@ def run_ctas_query(source_database_name, source_table_name, target_database_name
     return run_query(target_database_name, query,
                      query_result_location=query_result_location,
                      delete_output=True,
-                     workgroup=workgroup)
+                     workgroup=workgroup,
+                     poller=poller,
+                     scheduler=scheduler)
 
 
 # Returns list of columns to select from source table in CTAS statement.
@@ -284,6 +1159,7 @@ def _build_ctas_with(data_format, external_location, partition_columns=None, buc
     return ','.join(with_conditions)
 
 
+@trace.traced
 def get_work_group(workgroup_name, athena_client=None):
     if athena_client is None:
         athena_client = create_client()
@@ -296,6 +1172,7 @@ def get_work_group(workgroup_name, athena_client=None):
             return workgroup_response
 
 
+@trace.traced
 def create_work_group(workgroup_name, output_location, description=None, encryption_option='SSE_S3',
                       enforce_workgroup_configuration=False, publish_cloudwatch_metics=True, athena_client=None):
     if athena_client is None:
@@ -338,9 +1215,10 @@ def create_work_group(workgroup_name, output_location, description=None, encrypt
         raise ValueError(f"Failed to create workgroup {workgroup_name}!")
 
 
+@trace.traced
 def convert_database(source_database_name, target_database_name, target_classification, target_s3_uri,
                      table_config=None, default_partition_by=None, query_result_location=None, workgroup=None,
-                     max_concurrent=CONVERT_MAX_CONCURRENT):
+                     max_concurrent=CONVERT_MAX_CONCURRENT, poller=None, scheduler=None):
     logger = log.get_logger()
     logger.info(f"convert database {source_database_name} to {target_database_name} in format {target_classification}, "
                 f"target_s3_uri={target_s3_uri}, workgroup={workgroup}")
@@ -361,6 +1239,10 @@ def convert_database(source_database_name, target_database_name, target_classifi
     # get list of glue tables in source database
     table_list = glue.get_table_list(source_database_name)
 
+    # all table threads wait on one poller instead of polling their own query
+    if poller is None:
+        poller = get_query_poller()
+
     with ThreadPoolExecutor(max_workers=min(max_concurrent, len(table_list))) as executor:
         futures = {}
 
@@ -368,19 +1250,24 @@ def convert_database(source_database_name, target_database_name, target_classifi
             partition_columns = table_partition[table_name] if table_name in table_partition else default_partition_by
             futures[executor.submit(convert_table, source_database_name, target_database_name, table_name,
                                     target_classification, target_s3_uri, query_result_location,
-                                    partition_columns, workgroup=workgroup)] = table_name
-
-        for future in as_completed(futures):
-            try:
-                data_scanned = future.result()
-                logger.info(f"{futures[future]}: Data scanned={data_scanned}")
-                total_data_scanned += data_scanned
-                table_count += 1
-            except Exception as e:
-                logger.exception("Failed to convert table {}.{}: {}".format(target_database_name, futures[future], e))
-                convert_exception = e
-            finally:
-                del futures[future]
+                                    partition_columns, workgroup=workgroup, poller=poller,
+                                    scheduler=scheduler)] = table_name
+
+        with log.ProgressSummary(f"convert database {target_database_name}", logger=logger,
+                                 unit='tables') as progress:
+            for future in as_completed(futures):
+                try:
+                    data_scanned = future.result()
+                    logger.info(f"{futures[future]}: Data scanned={data_scanned}")
+                    progress.add(byte_count=data_scanned)
+                    total_data_scanned += data_scanned
+                    table_count += 1
+                except Exception as e:
+                    logger.exception("Failed to convert table {}.{}: {}".format(target_database_name, futures[future],
+                                                                                e))
+                    convert_exception = e
+                finally:
+                    del futures[future]
 
     logger.info("Converted database {}, {} tables. Total data scanned={}KB, cost=${}"
                 . format(target_database_name, table_count, total_data_scanned/KB, total_data_scanned*COST_PER_BYTE))
@@ -390,10 +1277,13 @@ def convert_database(source_database_name, target_database_name, target_classifi
         raise convert_exception
 
 
+@trace.traced
 def convert_table(source_database_name, target_database_name, table_name, target_classification,
-                  target_s3_uri, partition_columns=None, query_result_location=None, workgroup=None):
+                  target_s3_uri, partition_columns=None, query_result_location=None, workgroup=None, poller=None,
+                  scheduler=None):
     logger = log.get_logger()
-    logger.info(f"Converting table {target_database_name}.{table_name} in {target_classification} format")
+    log.log_sampled(logger, logging.INFO, "Converting table %s.%s in %s format", target_database_name, table_name,
+                    target_classification)
 
     ctas_table_name = f"ctas_{table_name}"
 
@@ -410,24 +1300,28 @@ def convert_table(source_database_name, target_database_name, table_name, target
                                    ctas_target_table_s3_uri, target_classification,
                                    partition_columns=target_partition_columns,
                                    query_result_location=query_result_location,
-                                   workgroup=workgroup)
+                                   workgroup=workgroup,
+                                   poller=poller,
+                                   scheduler=scheduler)
 
         # copy converted files from temporary table location to target table location
         copy_flag = glue.copy_table(target_database_name, target_database_name, ctas_table_name, table_name,
                                     target_table_s3_uri, target_classification, target_partition_columns,
                                     copy_partitions_flag=True, copy_files_flag=True)
-        logger.info(f"{target_database_name}.{table_name}: Copied table {copy_flag}")
+        log.log_sampled(logger, logging.INFO, "%s.%s: Copied table %s", target_database_name, table_name, copy_flag)
 
         # use Athena to recover new partitions
         # if target_partition_columns:
         #    refresh_partitions(target_database_name, table_name, query_result_location)
 
-        logger.info(f"Converted {source_database_name}.{table_name} to {target_table_s3_uri}")
+        log.log_sampled(logger, logging.INFO, "Converted %s.%s to %s", source_database_name, table_name,
+                        target_table_s3_uri)
 
         return ctas_resp['Statistics']['DataScannedInBytes']\
             if 'Statistics' in ctas_resp and 'DataScannedInBytes' in ctas_resp['Statistics']\
             else 0
     finally:
         # delete converted table and files
-        logger.info(f"{target_database_name}.{table_name}: will delete table {ctas_table_name}")
+        log.log_sampled(logger, logging.INFO, "%s.%s: will delete table %s", target_database_name, table_name,
+                        ctas_table_name)
         glue.delete_table(target_database_name, ctas_table_name, delete_files=False)
@@ -2,6 +2,7 @@ import os
 import boto3
 from cachetools.func import ttl_cache
 from pprint import pprint
+from .. import metrics
 
 
 @ttl_cache(maxsize=None, ttl=43200)
@@ -49,7 +50,7 @@ def create_client(resource_type, use_role=None, region_name=None, assumed_role=N
     else:
         client = boto3.client(resource_type, **kwargs)
 
-    return client
+    return metrics.register_client(client)
 
 
 def create_resource(resource_type, use_role=None, region_name=None, assumed_role=None):
@@ -70,4 +71,6 @@ def create_resource(resource_type, use_role=None, region_name=None, assumed_role
     else:
         resource = boto3.resource(resource_type, **kwargs)
 
+    metrics.register_client(resource.meta.client)
+
     return resource
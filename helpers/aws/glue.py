@@ -1,5 +1,7 @@
+import logging
 from . import client, s3
 from .. import log
+from .. import trace
 from botocore.exceptions import ClientError, ParamValidationError
 
 
@@ -43,6 +45,7 @@ def create_client():
 
 
 # Returns database definition if exists
+@trace.traced
 def get_database(database_name, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -61,6 +64,7 @@ def get_database(database_name, glue_client=None):
     return None
 
 
+@trace.traced
 def insert_database(database_name):
     created = False
 
@@ -81,6 +85,7 @@ def insert_database(database_name):
 
 
 # Returns list of table names for a database
+@trace.traced
 def get_table_list(database_name, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -97,6 +102,7 @@ def get_table_list(database_name, glue_client=None):
 
 
 # Returns table definition if exists
+@trace.traced
 def get_table(database_name, table_name, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -112,6 +118,7 @@ def get_table(database_name, table_name, glue_client=None):
     return None
 
 
+@trace.traced
 def insert_table(database_name, table_input, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -122,6 +129,7 @@ def insert_table(database_name, table_input, glue_client=None):
     )
 
 
+@trace.traced
 def update_table(database_name, table_input, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -132,6 +140,7 @@ def update_table(database_name, table_input, glue_client=None):
     )
 
 
+@trace.traced
 def delete_table(database_name, table_name, glue_client=None, delete_files=False):
     if glue_client is None:
         glue_client = create_client()
@@ -156,6 +165,7 @@ def delete_table(database_name, table_name, glue_client=None, delete_files=False
     glue_client.delete_table(DatabaseName=database_name, Name=table_name)
 
 
+@trace.traced
 def get_columns(database_name, table_name, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -175,6 +185,7 @@ def get_columns(database_name, table_name, glue_client=None):
     return column_dict
 
 
+@trace.traced
 def get_partition_columns(database_name, table_name, glue_client=None):
     table_definition = get_table(database_name, table_name, glue_client=glue_client)
 
@@ -188,6 +199,7 @@ def get_partition_columns(database_name, table_name, glue_client=None):
     return [{'Name': col['Name'], 'Type': col['Type']} for col in partition_keys]
 
 
+@trace.traced
 def build_partition_columns(database_name, table_name, default_partition_columns):
     columns = get_columns(database_name, table_name)
     return [col_name for col_name in default_partition_columns if col_name in columns]
@@ -212,6 +224,7 @@ def yield_partitions(database_name, table_name, glue_client=None, max_results=No
                        'StorageDescriptor': response_partition['StorageDescriptor']}
 
 
+@trace.traced
 def get_all_partition_values(database_name, table_name, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -221,6 +234,7 @@ def get_all_partition_values(database_name, table_name, glue_client=None):
 
 
 # Creates one or more partitions to a table
+@trace.traced
 def insert_partitions(database_name, table_name, partition_input_list, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -237,6 +251,7 @@ def insert_partitions(database_name, table_name, partition_input_list, glue_clie
         return glue_client.batch_create_partition(PartitionInputList=partition_input_list, **create_kwargs)
 
 
+@trace.traced
 def delete_partitions(database_name, table_name, partitions_to_delete, glue_client=None):
     if glue_client is None:
         glue_client = create_client()
@@ -246,6 +261,7 @@ def delete_partitions(database_name, table_name, partitions_to_delete, glue_clie
                                               PartitionsToDelete=partitions_to_delete)
 
 
+@trace.traced
 def delete_all_partitions(database_name, table_name, delete_files=False, glue_client=None):
     partitions = yield_partitions(database_name, table_name, glue_client=glue_client)
 
@@ -259,6 +275,7 @@ def delete_all_partitions(database_name, table_name, delete_files=False, glue_cl
     return len(partitions_to_delete)
 
 
+@trace.traced
 def get_location_uri(database_name, table_name, glue_client=None):
     table_definition = get_table(database_name, table_name, glue_client=glue_client)
 
@@ -272,12 +289,13 @@ def get_location_uri(database_name, table_name, glue_client=None):
 # If target table already exists, source columns and partitions are merged into existing definition.
 # If copy_partitions_flag is True, partition metadata is copied to target table and updated with the target S3 location.
 # If copy_files_flag is True, S3 data files are copied from source location to target location.
+@trace.traced
 def copy_table(source_database_name, target_database_name, source_table_name, target_table_name,
                target_location_uri, classification, target_partition_columns=None,
                copy_partitions_flag=True, copy_files_flag=True, glue_client=None):
     logger = log.get_logger()
-    logger.info(f"Copying table {source_database_name}.{source_table_name} to "
-                f"{target_database_name}.{target_table_name}")
+    log.log_sampled(logger, logging.INFO, "Copying table %s.%s to %s.%s", source_database_name, source_table_name,
+                    target_database_name, target_table_name)
 
     if glue_client is None:
         glue_client = create_client()
@@ -300,8 +318,8 @@ def copy_table(source_database_name, target_database_name, source_table_name, ta
         partition_count = copy_partitions(source_database_name, target_database_name,
                                           source_table_name, target_table_name, glue_client=glue_client)
 
-    logger.info(f"Created table {target_database_name}.{target_table_name}, changed={updated_flag}; "
-                f"copied partitions={partition_count}, files={file_count}")
+    log.log_sampled(logger, logging.INFO, "Created table %s.%s, changed=%s; copied partitions=%s, files=%s",
+                    target_database_name, target_table_name, updated_flag, partition_count, file_count)
 
     return updated_flag
 
@@ -309,6 +327,7 @@ def copy_table(source_database_name, target_database_name, source_table_name, ta
 # Copy partitions from source table to target table.
 # Data location is updated to reflect target table location on S3.
 # Actual S3 data files that are associated with the partitions are not copied.
+@trace.traced
 def copy_partitions(source_database_name, target_database_name, source_table_name, target_table_name,
                     glue_client=None):
     if glue_client is None:
@@ -357,6 +376,7 @@ def copy_partitions(source_database_name, target_database_name, source_table_nam
     return len(partition_input_list)
 
 
+@trace.traced
 def create_table(database_name, table_name, column_list, s3_uri, classification,
                  partition_columns=None, overwrite=False, glue_client=None):
     if not column_list:
@@ -1,13 +1,29 @@
+import csv
+import functools
+import gzip
+import io
+import itertools
+import logging
 import os
+import re
 import time
 import uuid
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+import simplejson as json
 from .. import log
+from .. import metrics
+from .. import trace
 from .. import util
 from .. import file
 from . import client
 from ..exception import NoSuchS3File
 from boto3.exceptions import S3UploadFailedError
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 
 def create_client():
@@ -26,6 +42,7 @@ def build_file_uri(bucket_name, file_path, protocol="s3"):
     return f"{protocol}://{bucket_name}/{file_path}"
 
 
+@trace.traced
 def prefix_exists(bucket, prefix, include_suffix=None, s3_client=None):
     if s3_client is None:
         s3_client = create_client()
@@ -46,6 +63,7 @@ def prefix_exists(bucket, prefix, include_suffix=None, s3_client=None):
     return False
 
 
+@trace.traced
 def uri_exists(s3_uri):
     bucket, prefix = parse_bucket_and_prefix_from_uri(s3_uri)
     return prefix_exists(bucket, prefix)
@@ -80,6 +98,185 @@ def yield_file_detail_list(bucket, prefix=None, s3_client=None, include_suffix=N
                             return
 
 
+# S3 Inventory reports are written to <destination-prefix>/<source-bucket>/<config-id>/<YYYY-MM-DDTHH-MMZ>/
+INVENTORY_FOLDER_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}-\d{2}Z/$')
+
+
+# Returns key of the most recent inventory manifest.json under inventory_prefix, or None if there isn't one
+@trace.traced
+def get_latest_inventory_manifest_key(bucket, inventory_prefix, s3_client=None):
+    if s3_client is None:
+        s3_client = create_client()
+
+    folder_list = sorted([folder_name for folder_name in yield_folder_list(bucket, inventory_prefix,
+                                                                            s3_client=s3_client)
+                          if INVENTORY_FOLDER_PATTERN.search(folder_name)])
+
+    for folder_name in reversed(folder_list):
+        manifest_key = f"{folder_name}manifest.json"
+        if prefix_exists(bucket, manifest_key, include_suffix='manifest.json', s3_client=s3_client):
+            return manifest_key
+
+    return None
+
+
+@trace.traced
+def read_inventory_manifest(bucket, manifest_key, s3_client=None):
+    if s3_client is None:
+        s3_client = create_client()
+
+    response = s3_client.get_object(Bucket=bucket, Key=manifest_key)
+
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+
+# Reads an S3 Inventory report (CSV, ORC or Parquet) and yields the same dictionaries as yield_file_detail_list.
+# Inventory rows are filtered by prefix and suffix while the data files are streamed.
+# Keys written after the inventory snapshot can be merged in by listing recent_prefixes, e.g. today's partition.
+# Keys deleted after the snapshot are still reported since the inventory has no record of the delete.
+def yield_inventory_file_detail_list(bucket, manifest_key, prefix=None, s3_client=None, include_suffix=None,
+                                     max_keys=None, recent_prefixes=None):
+    if s3_client is None:
+        s3_client = create_client()
+
+    manifest = read_inventory_manifest(bucket, manifest_key, s3_client=s3_client)
+
+    source_bucket = manifest['sourceBucket']
+    snapshot_time = datetime.fromtimestamp(int(manifest['creationTimestamp']) / 1000, tz=timezone.utc)
+
+    # list keys that changed after the snapshot first, so they replace stale inventory entries
+    recent_file_dict = {}
+    for recent_prefix in (recent_prefixes or []):
+        for f in yield_file_detail_list(source_bucket, recent_prefix, s3_client=s3_client,
+                                        include_suffix=include_suffix):
+            if f['LastModified'] >= snapshot_time and _inventory_key_matches(f['Key'], prefix, include_suffix):
+                recent_file_dict[f['Key']] = f
+
+    file_count = 0
+
+    for f in _yield_inventory_records(manifest, s3_client):
+        if f['Key'] in recent_file_dict or not _inventory_key_matches(f['Key'], prefix, include_suffix):
+            continue
+
+        yield f
+
+        if max_keys is not None:
+            file_count += 1
+            if file_count >= max_keys:
+                return
+
+    for f in recent_file_dict.values():
+        yield f
+
+        if max_keys is not None:
+            file_count += 1
+            if file_count >= max_keys:
+                return
+
+
+def _inventory_key_matches(key, prefix=None, include_suffix=None):
+    if prefix is not None and not key.startswith(prefix):
+        return False
+
+    if include_suffix is not None:
+        return key.endswith(include_suffix)
+
+    # exclude folders
+    return not key.endswith('/')
+
+
+# Yields current, non-deleted inventory rows converted to list_objects_v2 "Contents" dictionaries
+def _yield_inventory_records(manifest, s3_client):
+    data_bucket = manifest['destinationBucket'].split(':::')[-1]
+    file_format = manifest['fileFormat'].upper()
+
+    if file_format == 'CSV':
+        # CSV schema is a comma separated list, e.g. "Bucket, Key, Size, LastModifiedDate, ETag"
+        column_names = [_to_inventory_column_name(col) for col in manifest['fileSchema'].split(',')]
+    elif file_format not in ('ORC', 'PARQUET'):
+        raise ValueError(f"Unsupported S3 Inventory file format {manifest['fileFormat']}.")
+
+    for data_file in manifest['files']:
+        if file_format == 'CSV':
+            records = _yield_inventory_csv_file(data_bucket, data_file['key'], column_names, s3_client)
+        else:
+            records = _yield_inventory_columnar_file(data_bucket, data_file['key'], file_format, s3_client)
+
+        for record in records:
+            if record.get('is_delete_marker') in (True, 'true') or record.get('is_latest') in (False, 'false'):
+                continue
+
+            yield _build_inventory_file_detail(record)
+
+
+# Converts CSV schema names to the names used by ORC and Parquet reports, e.g. LastModifiedDate -> last_modified_date
+def _to_inventory_column_name(column_name):
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])', '_', column_name.strip()).lower()
+
+
+def _yield_inventory_csv_file(bucket, key, column_names, s3_client):
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+
+    # stream gzipped csv without writing it to local disk
+    with gzip.GzipFile(fileobj=response['Body']) as gz_in:
+        fh = io.TextIOWrapper(gz_in, encoding='utf-8', newline='')
+        for row in csv.reader(fh):
+            if row:
+                record = dict(zip(column_names, row))
+                # object keys are URL-encoded in CSV reports
+                record['key'] = unquote_plus(record['key'])
+                yield record
+
+
+def _yield_inventory_columnar_file(bucket, key, file_format, s3_client):
+    try:
+        import pyarrow.orc as orc
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"pyarrow is required to read {file_format} S3 Inventory reports") from e
+
+    # columnar readers need a seekable file
+    local_file = '/tmp/{}_{}' . format(uuid.uuid4(), os.path.basename(key))
+
+    try:
+        s3_client.download_file(bucket, key, local_file)
+
+        if file_format == 'ORC':
+            orc_file = orc.ORCFile(local_file)
+            batches = (orc_file.read_stripe(i) for i in range(orc_file.nstripes))
+        else:
+            batches = pq.ParquetFile(local_file).iter_batches()
+
+        for batch in batches:
+            for record in batch.to_pylist():
+                yield record
+    finally:
+        file.delete_local_path(local_file)
+
+
+def _build_inventory_file_detail(record):
+    detail = {'Key': record['key']}
+
+    if record.get('last_modified_date') not in (None, ''):
+        last_modified = record['last_modified_date']
+        if isinstance(last_modified, str):
+            last_modified = datetime.strptime(last_modified, '%Y-%m-%dT%H:%M:%S.%fZ')
+        detail['LastModified'] = last_modified if last_modified.tzinfo is not None \
+            else last_modified.replace(tzinfo=timezone.utc)
+
+    # list_objects_v2 returns quoted ETags
+    if record.get('e_tag') not in (None, ''):
+        detail['ETag'] = f'"{record["e_tag"]}"'
+
+    if record.get('size') not in (None, ''):
+        detail['Size'] = int(record['size'])
+
+    if record.get('storage_class') not in (None, ''):
+        detail['StorageClass'] = record['storage_class']
+
+    return detail
+
+
 def yield_file_list(bucket, prefix=None, s3_client=None, include_suffix=None, max_keys=None):
     kwargs = {}
     if max_keys is not None:
@@ -109,6 +306,7 @@ def yield_file_list(bucket, prefix=None, s3_client=None, include_suffix=None, ma
                             return
 
 
+@trace.traced
 def get_full_file_list(bucket, prefix=None, s3_client=None, include_suffix=None, max_keys=None):
     return list(yield_file_list(bucket,
                                 prefix,
@@ -117,6 +315,7 @@ def get_full_file_list(bucket, prefix=None, s3_client=None, include_suffix=None,
                                 max_keys=max_keys))
 
 
+@trace.traced
 def get_file_list(bucket, prefix=None, s3_client=None, include_suffix=None, continuation_token=None, max_keys=None):
     kwargs = {}
     if continuation_token is not None:
@@ -205,6 +404,7 @@ def yield_folder_list(bucket, prefix=None, s3_client=None, include_suffix=None,
                         return
 
 
+@trace.traced
 def get_full_folder_list(bucket, prefix=None, s3_client=None, include_suffix=None, max_keys=None):
     return list(yield_folder_list(bucket,
                                   prefix=prefix,
@@ -213,6 +413,7 @@ def get_full_folder_list(bucket, prefix=None, s3_client=None, include_suffix=Non
                                   max_keys=max_keys))
 
 
+@trace.traced
 def get_recursive_folder_list(bucket, prefix=None, s3_client=None, include_suffix=None):
     if s3_client is None:
         s3_client = create_client()
@@ -236,6 +437,7 @@ def get_recursive_folder_list(bucket, prefix=None, s3_client=None, include_suffi
     return full_folder_list
 
 
+@trace.traced
 def get_folder_list(bucket, prefix=None, s3_client=None, include_suffix=None, exclude_suffix=None,
                     continuation_token=None, max_keys=None):
     kwargs = {}
@@ -279,10 +481,12 @@ def get_folder_list(bucket, prefix=None, s3_client=None, include_suffix=None, ex
     return folder_list, new_continuation_token
 
 
+@trace.traced
 def is_folder_empty(bucket, prefix=None, include_suffix=None, s3_client=None):
     return len(get_full_file_list(bucket, prefix, s3_client=s3_client, include_suffix=include_suffix, max_keys=1)) <= 0
 
 
+@trace.traced
 def copy_file_to_folder(source_bucket, source_file_key, target_bucket, target_folder, s3_client=None,
                         target_file_name=None, target_suffix=None):
     file_name = os.path.basename(source_file_key) if target_file_name is None else target_file_name
@@ -309,6 +513,7 @@ def copy_file_to_folder(source_bucket, source_file_key, target_bucket, target_fo
     return target_file_key
 
 
+@trace.traced
 def move_file_to_folder(source_bucket, source_file_key, target_bucket, target_folder, s3_client=None,
                         target_file_name=None, target_suffix=None):
     if copy_file_to_folder(source_bucket, source_file_key, target_bucket, target_folder, s3_client=s3_client,
@@ -316,6 +521,7 @@ def move_file_to_folder(source_bucket, source_file_key, target_bucket, target_fo
         delete_file(source_bucket, source_file_key, s3_client=s3_client)
 
 
+@trace.traced
 def move_folder(source_bucket, source_folder, target_bucket, target_folder):
     target_prefix = os.path.join(target_folder, os.path.basename(source_folder.rstrip('/')))
 
@@ -324,6 +530,7 @@ def move_folder(source_bucket, source_folder, target_bucket, target_folder):
 
 
 # Copies files from source_uri to target_uri recursively
+@trace.traced
 def copy_uri(source_uri, target_uri, include_suffix=None):
     source_bucket, source_prefix = parse_bucket_and_prefix_from_uri(source_uri)
     target_bucket, target_prefix = parse_bucket_and_prefix_from_uri(target_uri)
@@ -349,6 +556,7 @@ def append_subfolder_tree_to_target(file_name, source_folder, target_folder):
 
 
 # Copies files from source_bucket/source_folder to target_bucket/target_folder recursively
+@trace.traced
 def copy_folder(source_bucket, source_folder, target_bucket, target_folder, include_suffix=None):
     s3_client = create_client()
 
@@ -376,6 +584,7 @@ def copy_folder(source_bucket, source_folder, target_bucket, target_folder, incl
     return file_count
 
 
+@trace.traced
 def delete_uri_list(s3_uri_list, s3=None):
     if s3 is None:
         s3 = client.create_resource('s3')
@@ -384,11 +593,13 @@ def delete_uri_list(s3_uri_list, s3=None):
         delete_uri(s3_uri, s3=s3)
 
 
+@trace.traced
 def delete_uri(s3_uri, s3=None):
     bucket, prefix = parse_bucket_and_prefix_from_uri(s3_uri)
     return delete_path(bucket, prefix, s3=s3)
 
 
+@trace.traced
 def delete_path(bucket, prefix, s3=None):
     if s3 is None:
         s3 = client.create_resource('s3')
@@ -396,6 +607,7 @@ def delete_path(bucket, prefix, s3=None):
     return s3.Bucket(bucket).objects.filter(Prefix=prefix).delete()
 
 
+@trace.traced
 def delete_path_list(bucket, prefix_list, max_concurrent_deletes=500):
     s3_client = create_client()
 
@@ -413,12 +625,14 @@ def delete_path_list(bucket, prefix_list, max_concurrent_deletes=500):
         delete_file_list(bucket, batch_file_list, s3_client=s3_client)
 
 
+@trace.traced
 def delete_file(bucket, file_key, s3_client=None):
     if s3_client is None:
         s3_client = create_client()
     return s3_client.delete_object(Bucket=bucket, Key=file_key)
 
 
+@trace.traced
 def delete_file_list(bucket, file_list, s3_client=None):
     if s3_client is None:
         s3_client = create_client()
@@ -428,6 +642,7 @@ def delete_file_list(bucket, file_list, s3_client=None):
     return s3_client.delete_objects(Bucket=bucket, Delete={'Objects': delete_objects})
 
 
+@trace.traced
 def get_file_size(bucket, file_key, s3_resource=None):
     if s3_resource is None:
         s3_resource = create_resource()
@@ -443,7 +658,30 @@ def get_file_size(bucket, file_key, s3_resource=None):
             raise e
 
 
+# Returns True if the S3 object has the ETag of the local file uploaded in parts of part_size bytes,
+# compares content with one local read and a head request instead of a download
+@trace.traced
+def is_file_etag_equal(local_file, bucket, file_key, part_size=util.S3_MULTIPART_CHUNK_SIZE,
+                       multipart_threshold=util.S3_MULTIPART_THRESHOLD, max_workers=None, s3_resource=None):
+    if s3_resource is None:
+        s3_resource = create_resource()
+
+    s3_object = s3_resource.Object(bucket, file_key)
+
+    try:
+        etag = s3_object.e_tag
+    except ClientError as e:
+        if e.response['Error']['Code'] == '404':
+            raise NoSuchS3File(e)
+        else:
+            raise e
+
+    return etag == file.get_file_etag(local_file, part_size=part_size, multipart_threshold=multipart_threshold,
+                                      max_workers=max_workers)
+
+
 # write content to a new file on S3
+@trace.traced
 def write_file(bucket, key, body=None, md5sum=None, s3_client=None, **kwargs):
     if s3_client is None:
         s3_client = create_client()
@@ -466,6 +704,7 @@ def write_file(bucket, key, body=None, md5sum=None, s3_client=None, **kwargs):
     return response['ETag']
 
 
+@trace.traced
 def read_file(bucket, key):
     uid = uuid.uuid4()
     local_file = '/tmp/{}_{}' . format(uid, key.replace("/", "_"))
@@ -480,8 +719,84 @@ def read_file(bucket, key):
     return file_content
 
 
+# Streams an S3 object as a binary file object without writing it to local disk.
+# With max_workers, byte ranges of chunk_size bytes are downloaded by parallel ranged GETs,
+# at most max_workers ranges ahead of the reader, and read in order.
+@trace.traced
+def open_file_stream(bucket, key, max_workers=None, chunk_size=util.S3_MULTIPART_CHUNK_SIZE, s3_client=None):
+    return io.BufferedReader(_ChunkReader(yield_file_chunks(bucket, key, max_workers=max_workers,
+                                                            chunk_size=chunk_size, s3_client=s3_client)),
+                             buffer_size=STREAM_CHUNK_SIZE)
+
+
+# Yields the content of an S3 object in order as chunks of bytes, see open_file_stream
+def yield_file_chunks(bucket, key, max_workers=None, chunk_size=util.S3_MULTIPART_CHUNK_SIZE, s3_client=None):
+    if s3_client is None:
+        s3_client = create_client()
+
+    try:
+        if not max_workers or max_workers <= 1:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            yield from response['Body'].iter_chunks(STREAM_CHUNK_SIZE)
+            return
+
+        file_size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            raise NoSuchS3File(e)
+        raise e
+
+    def _get_range(start):
+        end = min(start + chunk_size, file_size) - 1
+        return s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body'].read()
+
+    range_starts = iter(range(0, file_size, chunk_size))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = [executor.submit(_get_range, start) for start in itertools.islice(range_starts, max_workers)]
+        try:
+            while pending:
+                chunk = pending.pop(0).result()
+                start = next(range_starts, None)
+                if start is not None:
+                    pending.append(executor.submit(_get_range, start))
+
+                yield chunk
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Raw binary file object over an iterator of bytes chunks
+class _ChunkReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.chunks.close()
+        super().close()
+
+
+@trace.traced
 def download_file(bucket, key, download_dir=None, s3_client=None, local_file_name=None):
-    if local_file_name is not None:
+    if local_file_name is None:
         file.ensure_local_path_exists(download_dir)
         download_path = os.path.join(download_dir, os.path.basename(key))
     else:
@@ -500,6 +815,7 @@ def download_file(bucket, key, download_dir=None, s3_client=None, local_file_nam
             if e.response['Error']['Code'] == '404':
                 raise NoSuchS3File(e)
             elif e.response['Error']['Code'] == '503' or e.response['Error']['Code'] == 'SlowDown':
+                metrics.increment('s3.slowdown_retries', tags={'function': 'download_file'})
                 max_retry_count -= 1
                 if max_retry_count <= 0:
                     raise e
@@ -510,18 +826,21 @@ def download_file(bucket, key, download_dir=None, s3_client=None, local_file_nam
     return download_path
 
 
+@trace.traced
 def download_uri(s3_uri, download_dir, s3_client=None):
     bucket, key = parse_bucket_and_prefix_from_uri(s3_uri)
     return download_file(bucket, key, download_dir, s3_client)
 
 
 # download s3 file to a local temp file
+@trace.traced
 def download_file_to_tmp(bucket, key, s3_client=None):
     # use uuid to create a unique local file name
     return download_file(bucket, key, '/tmp', s3_client)
 
 
 # Copies files from source_bucket/source_folder to local file system recursively
+@trace.traced
 def download_folder(source_bucket, source_folder, target_folder, include_suffix=None, s3_client=None):
     if s3_client is None:
         s3_client = create_client()
@@ -549,17 +868,19 @@ def download_folder(source_bucket, source_folder, target_folder, include_suffix=
 
 
 # Copies files from source_bucket/source_folder to /tmp recursively
+@trace.traced
 def download_folder_to_tmp(source_bucket, source_folder, include_suffix=None, s3_client=None):
     return download_folder(source_bucket, source_folder, '/tmp', include_suffix, s3_client)
 
 
+@trace.traced
 def upload_file(local_file, target_bucket, target_key, md5sum=None, content_type=None, delete_local_file=False,
                 s3_client=None):
     if s3_client is None:
         s3_client = create_client()
 
     if md5sum is None:
-        md5sum = util.get_md5sum(open(local_file, 'rb').read())
+        md5sum = file.get_file_md5sum(local_file)
 
     extra_args = {
         'ServerSideEncryption': 'AES256',
@@ -578,6 +899,7 @@ def upload_file(local_file, target_bucket, target_key, md5sum=None, content_type
             max_retry_count = 0
         except ClientError as e:
             if e.response['Error']['Code'] == '503' or e.response['Error']['Code'] == 'SlowDown':
+                metrics.increment('s3.slowdown_retries', tags={'function': 'upload_file'})
                 max_retry_count -= 1
                 if max_retry_count <= 0:
                     raise e
@@ -594,6 +916,7 @@ def upload_file(local_file, target_bucket, target_key, md5sum=None, content_type
 
 # local_folder = /tmp/src_filename/schema/assessment
 # target_folder = pass/precatalog/src_filename/schema/assessment
+@trace.traced
 def upload_folder(local_folder, target_bucket, target_folder, content_type=None, delete_local_folder=False,
                   s3_client=None):
     if s3_client is None:
@@ -615,9 +938,12 @@ def upload_folder(local_folder, target_bucket, target_folder, content_type=None,
 
 
 # decorator to download input file from S3 and upload output file(s) back to S3
+# per-file log lines are sampled, pass the log.ProgressSummary of a batch of files as progress
+# to count the file in the summary, e.g. with log.ProgressSummary('compress', unit='files') as progress:
 def file_transfer_handler(func):
+    @functools.wraps(func)
     def decorator(bucket, key, s3_client=None, destination_bucket=None, destination_folder=None,
-                  delete_source=True, *args, **kwargs):
+                  delete_source=True, *args, progress=None, **kwargs):
         logger = log.get_logger()
 
         target_bucket = destination_bucket if destination_bucket is not None else bucket
@@ -635,7 +961,8 @@ def file_transfer_handler(func):
 
             # download s3 file to a local temp file
             downloaded_name = download_file(bucket, key, local_file_name=local_file)
-            logger.info(f"Downloaded {bucket}/{key} to {downloaded_name}")
+            downloaded_size = file.get_file_size(downloaded_name)
+            log.log_sampled(logger, logging.INFO, "Downloaded %s/%s to %s", bucket, key, downloaded_name)
 
             # use local temp file in decorated function
             func_result = func(downloaded_name, *args, **kwargs)
@@ -645,7 +972,7 @@ def file_transfer_handler(func):
                 else func_result if isinstance(func_result, type([])) else [func_result]
 
             upload_count = len(upload_path_list)
-            logger.info(f"{func.__name__} complete: {upload_count}")
+            log.log_sampled(logger, logging.INFO, "%s complete: %s", func.__name__, upload_count)
 
             # function could have produced multiple output files
             # batch-upload all files only after everything processed successfully
@@ -657,15 +984,18 @@ def file_transfer_handler(func):
 
                 # upload output file to s3
                 upload_file(upload_path, target_bucket, upload_key, delete_local_file=False, s3_client=s3_client)
-                logger.info(f"Uploaded to {target_bucket}/{upload_key}")
+                log.log_sampled(logger, logging.INFO, "Uploaded to %s/%s", target_bucket, upload_key)
 
             # delete original file only if new file name is different from original file name
             if delete_source and upload_path_list and \
                     (len(upload_path_list) > 1 or bucket != target_bucket or upload_key != key):
                 delete_file(bucket, key, s3_client=s3_client)
-                logger.info(f"Deleted {bucket}/{key}")
+                log.log_sampled(logger, logging.INFO, "Deleted %s/%s", bucket, key)
 
-            logger.info(f"{func.__name__} Done processing {bucket}/{key}: output {upload_count} files")
+            log.log_sampled(logger, logging.INFO, "%s Done processing %s/%s: output %s files", func.__name__, bucket,
+                            key, upload_count)
+            if progress is not None:
+                progress.add(byte_count=downloaded_size)
 
             return upload_count
         finally:
@@ -682,12 +1012,14 @@ def file_transfer_handler(func):
     return decorator
 
 
+@trace.traced
 @file_transfer_handler
 def compress(download_path):
     return file.compress_file(download_path)
 
 
-# May return multiple output files if max_lines_per_file is provided
+# May return multiple output files if max_lines_per_file or max_bytes_per_file is provided
+@trace.traced
 @file_transfer_handler
-def decompress(download_path, max_lines_per_file=None):
-    return file.decompress_file(download_path, max_lines_per_file)
+def decompress(download_path, max_lines_per_file=None, max_bytes_per_file=None):
+    return file.decompress_file(download_path, max_lines_per_file, max_bytes_per_file=max_bytes_per_file)
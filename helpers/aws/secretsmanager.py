@@ -2,11 +2,13 @@ import base64
 import simplejson as json
 from . import client
 from .. import log
+from .. import trace
 from botocore.exceptions import ClientError
 from cachetools.func import ttl_cache
 
 
 @ttl_cache(maxsize=None, ttl=900)
+@trace.traced
 def get_secret(secret_id, region_name=None):
     sm = client.create_client('secretsmanager', region_name=region_name)
 
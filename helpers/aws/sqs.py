@@ -1,5 +1,6 @@
 import json
 from . import client
+from .. import trace
 
 
 # set to 5 mins
@@ -10,6 +11,7 @@ def create_client():
     return client.create_client('sqs')
 
 
+@trace.traced
 def send_message(queue_url, message_body, sqs_client=None):
     if sqs_client is None:
         sqs_client = create_client()
@@ -20,6 +22,7 @@ def send_message(queue_url, message_body, sqs_client=None):
     return response['MessageId']
 
 
+@trace.traced
 def get_message_count(queue_url, sqs_client=None):
     if sqs_client is None:
         sqs_client = create_client()
@@ -30,6 +33,7 @@ def get_message_count(queue_url, sqs_client=None):
     return int(response['Attributes']['ApproximateNumberOfMessages'])
 
 
+@trace.traced
 def poll_for_message(queue_url, max_message=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
                      wait_time_seconds=None, sqs_client=None):
     if visibility_timeout is None:
@@ -49,6 +53,7 @@ def poll_for_message(queue_url, max_message=None, visibility_timeout=DEFAULT_VIS
     return response['Messages'] if response is not None and 'Messages' in response else []
 
 
+@trace.traced
 def change_visibility(queue_url, receipt_handle, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, sqs_client=None):
     if visibility_timeout is None:
         visibility_timeout = DEFAULT_VISIBILITY_TIMEOUT
@@ -61,6 +66,7 @@ def change_visibility(queue_url, receipt_handle, visibility_timeout=DEFAULT_VISI
                                         VisibilityTimeout=visibility_timeout)
 
 
+@trace.traced
 def delete_message(queue_url, receipt_handle, sqs_client=None):
     if sqs_client is None:
         sqs_client = create_client()
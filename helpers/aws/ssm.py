@@ -1,10 +1,12 @@
 import time
 from . import client
+from .. import trace
 from .. import util
 from botocore.exceptions import ClientError
 
 
 # APIs for AWS Systems Manager
+@trace.traced
 def get_parameter(parameter_name, region_name=None, required=True):
     parameter = _get_parameter(parameter_name, region_name, required)
 
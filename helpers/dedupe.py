@@ -0,0 +1,295 @@
+import heapq
+import itertools
+import mmap
+import os
+import tempfile
+from array import array
+from . import file
+from . import util
+
+
+FINGERPRINT_BITS = [64, 128]
+DEDUPE_INITIAL_CAPACITY = 1024
+DEDUPE_LOAD_FACTOR = 0.7
+BLOOM_BITS_PER_RECORD = 10
+BLOOM_HASH_COUNT = 7
+DEDUPE_MAX_RUNS = 4
+DEDUPE_WRITE_BATCH_SIZE = 64 * 1024
+_MASK_64 = 2 ** 64 - 1
+
+# Streaming record deduplication on fingerprints of util.get_md5sum_dict
+#
+# Fingerprints are the leading 64 or 128 bits of the md5 and are stored in array-backed open addressing tables,
+# 8 or 16 bytes per slot instead of a set of 32 character hex strings.  When the table would grow past
+# max_memory_bytes it is sorted and spilled to a run file in spill_dir, and new records are looked up in the
+# runs by binary search.  When there are more than DEDUPE_MAX_RUNS runs they are merged into one, so a lookup
+# searches at most DEDUPE_MAX_RUNS runs.  A Bloom filter per run (about 1.25 bytes per spilled record) skips most
+# run lookups.
+# 64 bit fingerprints collide with a probability of about n^2 / 2^65, use 128 bits for billions of records.
+
+
+class Deduplicator(object):
+    def __init__(self, fingerprint_bits=64, max_memory_bytes=None, bloom_filter=True, spill_dir=None,
+                 key_function=None):
+        if fingerprint_bits not in FINGERPRINT_BITS:
+            raise ValueError(f"Unsupported fingerprint_bits {fingerprint_bits}.  Supported values are: "
+                             f"{FINGERPRINT_BITS}")
+
+        self.fingerprint_bits = fingerprint_bits
+        self.max_memory_bytes = max_memory_bytes
+        self.bloom_filter = bloom_filter
+        self.spill_dir = spill_dir
+        self.key_function = key_function if key_function is not None else util.get_md5sum_dict
+        self.table = FingerprintTable(words=fingerprint_bits // 64)
+        self.runs = []
+        self.record_count = 0
+        self.unique_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Returns True the first time a record is added
+    def add(self, record):
+        self.record_count += 1
+        fingerprint = self.get_fingerprint(record)
+
+        if fingerprint in self.table:
+            return False
+
+        for run in self.runs:
+            if fingerprint in run:
+                return False
+
+        if self.table.is_full() and not self._can_grow():
+            self._spill()
+
+        self.table.add(fingerprint)
+        self.unique_count += 1
+
+        return True
+
+    # Yields records not seen before, in order
+    def filter_unique(self, records):
+        for record in records:
+            if self.add(record):
+                yield record
+
+    # Returns non-zero fingerprint from the leading bits of the record md5
+    def get_fingerprint(self, record):
+        fingerprint = int(self.key_function(record), 16) >> (128 - self.fingerprint_bits)
+        return fingerprint if fingerprint else 1
+
+    def memory_bytes(self):
+        return self.table.memory_bytes() + sum(run.memory_bytes() for run in self.runs)
+
+    # Returns memory used per unique record, spilled fingerprints only count their Bloom filter
+    def memory_per_record(self):
+        return self.memory_bytes() / self.unique_count if self.unique_count else 0
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+    def _can_grow(self):
+        return self.max_memory_bytes is None or 2 * self.table.memory_bytes() <= self.max_memory_bytes
+
+    def _spill(self):
+        fingerprints = self.table.sorted_fingerprints()
+        self.runs.append(SpilledRun(fingerprints, self.table.words, bloom_filter=self.bloom_filter,
+                                    spill_dir=self.spill_dir))
+        self.table.clear()
+
+        if len(self.runs) > DEDUPE_MAX_RUNS:
+            self._merge_runs()
+
+    # Merges the sorted runs into one run, streaming through the files.  Runs never share a fingerprint.
+    def _merge_runs(self):
+        runs = self.runs
+        merged_run = SpilledRun(heapq.merge(*(run.yield_fingerprints() for run in runs)), self.table.words,
+                                bloom_filter=self.bloom_filter, spill_dir=self.spill_dir,
+                                length=sum(len(run) for run in runs))
+
+        for run in runs:
+            run.close()
+        self.runs = [merged_run]
+
+
+# Yields records not seen before, see Deduplicator
+def filter_unique(records, fingerprint_bits=64, max_memory_bytes=None, bloom_filter=True, spill_dir=None,
+                  key_function=None):
+    with Deduplicator(fingerprint_bits=fingerprint_bits, max_memory_bytes=max_memory_bytes,
+                      bloom_filter=bloom_filter, spill_dir=spill_dir, key_function=key_function) as deduplicator:
+        yield from deduplicator.filter_unique(records)
+
+
+# Open addressing hash set of non-zero fingerprints of 1 or 2 64 bit words with linear probing,
+# zero marks an empty slot
+class FingerprintTable(object):
+    def __init__(self, words=1, capacity=DEDUPE_INITIAL_CAPACITY):
+        self.words = words
+        self.capacity = capacity
+        self.slots = array('Q', bytes(8 * words * capacity))
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, fingerprint):
+        return self.slots[self._find_slot(fingerprint) * self.words] != 0
+
+    def is_full(self):
+        return self.length + 1 > self.capacity * DEDUPE_LOAD_FACTOR
+
+    # Returns True if fingerprint was not in the table, doubles the capacity when full
+    def add(self, fingerprint):
+        if self.is_full():
+            self._resize(2 * self.capacity)
+
+        slot = self._find_slot(fingerprint)
+        if self.slots[slot * self.words]:
+            return False
+
+        self._set_slot(slot, fingerprint)
+        self.length += 1
+
+        return True
+
+    def clear(self):
+        self.slots = array('Q', bytes(8 * self.words * self.capacity))
+        self.length = 0
+
+    def sorted_fingerprints(self):
+        return sorted(self._yield_fingerprints())
+
+    def memory_bytes(self):
+        return self.slots.itemsize * len(self.slots)
+
+    def _find_slot(self, fingerprint):
+        mask = self.capacity - 1
+        slots = self.slots
+        slot = fingerprint & mask
+
+        if self.words == 1:
+            while slots[slot] and slots[slot] != fingerprint:
+                slot = (slot + 1) & mask
+        else:
+            high, low = fingerprint >> 64, fingerprint & _MASK_64
+            while slots[2 * slot] and (slots[2 * slot] != high or slots[2 * slot + 1] != low):
+                slot = (slot + 1) & mask
+
+        return slot
+
+    def _set_slot(self, slot, fingerprint):
+        if self.words == 1:
+            self.slots[slot] = fingerprint
+        else:
+            self.slots[2 * slot] = fingerprint >> 64
+            self.slots[2 * slot + 1] = fingerprint & _MASK_64
+
+    def _yield_fingerprints(self):
+        if self.words == 1:
+            yield from filter(None, self.slots)
+        else:
+            for slot in range(self.capacity):
+                if self.slots[2 * slot]:
+                    yield self.slots[2 * slot] << 64 | self.slots[2 * slot + 1]
+
+    def _resize(self, capacity):
+        fingerprints = list(self._yield_fingerprints())
+        self.capacity = capacity
+        self.clear()
+
+        for fingerprint in fingerprints:
+            self._set_slot(self._find_slot(fingerprint), fingerprint)
+        self.length = len(fingerprints)
+
+
+# Bloom filter of uniformly distributed fingerprints, the bit positions are derived by double hashing
+class BloomFilter(object):
+    def __init__(self, record_count, bits_per_record=BLOOM_BITS_PER_RECORD, hash_count=BLOOM_HASH_COUNT):
+        self.bit_count = max(8, record_count * bits_per_record)
+        self.hash_count = hash_count
+        self.bits = bytearray((self.bit_count + 7) // 8)
+
+    def __contains__(self, fingerprint):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+    def add(self, fingerprint):
+        for position in self._positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def _positions(self, fingerprint):
+        hash1 = fingerprint & 0xffffffff
+        hash2 = (fingerprint >> 32) & 0xffffffff | 1
+        return [(hash1 + i * hash2) % self.bit_count for i in range(self.hash_count)]
+
+
+# Sorted fingerprints written to a file and searched through a memory map.
+# fingerprints can be an iterator if length is given, it is written DEDUPE_WRITE_BATCH_SIZE at a time.
+class SpilledRun(object):
+    def __init__(self, fingerprints, words, bloom_filter=True, spill_dir=None, length=None):
+        self.words = words
+        self.length = length if length is not None else len(fingerprints)
+        self.bloom_filter = BloomFilter(self.length) if bloom_filter else None
+
+        fingerprints = iter(fingerprints)
+        fd, self.file_path = tempfile.mkstemp(prefix='dedupe_', suffix='.run', dir=spill_dir)
+        with os.fdopen(fd, 'wb') as fh:
+            for batch in iter(lambda: list(itertools.islice(fingerprints, DEDUPE_WRITE_BATCH_SIZE)), []):
+                if self.bloom_filter is not None:
+                    for fingerprint in batch:
+                        self.bloom_filter.add(fingerprint)
+
+                if words == 1:
+                    values = array('Q', batch)
+                else:
+                    values = array('Q', (word for fingerprint in batch for word in (fingerprint >> 64,
+                                                                                    fingerprint & _MASK_64)))
+                values.tofile(fh)
+
+        with open(self.file_path, 'rb') as fh:
+            self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.values = memoryview(self.mmap).cast('Q')
+
+    def __contains__(self, fingerprint):
+        if self.bloom_filter is not None and fingerprint not in self.bloom_filter:
+            return False
+
+        values = self.values
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            value = values[middle] if self.words == 1 else values[2 * middle] << 64 | values[2 * middle + 1]
+            if value < fingerprint:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low < self.length and (values[low] if self.words == 1 else
+                                      values[2 * low] << 64 | values[2 * low + 1]) == fingerprint
+
+    def __len__(self):
+        return self.length
+
+    def yield_fingerprints(self):
+        values = self.values
+        if self.words == 1:
+            yield from values
+        else:
+            for idx in range(self.length):
+                yield values[2 * idx] << 64 | values[2 * idx + 1]
+
+    def memory_bytes(self):
+        return self.bloom_filter.memory_bytes() if self.bloom_filter is not None else 0
+
+    def close(self):
+        self.values.release()
+        self.mmap.close()
+        file.delete_local_path(self.file_path)
@@ -1,49 +1,211 @@
+import atexit
+import collections
+import itertools
 import logging
 import logging.handlers
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
 
 # Common Logging Utility
 
+LOG_SAMPLE_EVERY = 100
+LOG_RATE_LIMIT_INTERVAL = 60
+PROGRESS_SUMMARY_INTERVAL = 60
+
+_LOGGER_CACHE = {}
+_QUEUE_LISTENERS = []
+_SAMPLE_COUNTERS = collections.defaultdict(itertools.count)
+_RATE_LIMITS = {}
+_RATE_LIMIT_LOCK = threading.Lock()
+_log_file_name = None
+_queue_logging_enabled = False
+
 
 # level = CRITICAL/FATAL, ERROR, WARNING, INFO, DEBUG, NOTSET
+# Loggers are cached by name and path, so calling get_logger() in hot functions is a dictionary lookup,
+# level=None keeps the level of a cached logger
 def get_logger(name=None, path=None, level=None):
+    cache_key = (name, path)
+    logger = _LOGGER_CACHE.get(cache_key)
+    if logger is not None:
+        if level is not None:
+            logger.setLevel(level.upper())
+        return logger
+
     if name is None:
         logger_name = get_log_file_name()
     else:
         logger_name = name
 
-    # logger = logging.getLogger(logger_name)
     logger = logging.getLogger(logger_name)
 
     if not logger.hasHandlers():
-        # log to stdout
-        ch = logging.StreamHandler()
-        ch.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
-        logger.addHandler(ch)
-
-        # log to rotating file, max size is 10MB per file
-        log_file_path = _build_log_file_path(path)
-        if log_file_path is not None:
-            log_file_name = os.path.join(log_file_path, logger_name)
-            fh = logging.handlers.RotatingFileHandler(log_file_name,
-                                                      maxBytes=1024*1024*10,
-                                                      backupCount=5,
-                                                      encoding="utf8")
-            fh.setFormatter(logging.Formatter('%(asctime)s %(process)d [%(levelname)s] %(message)s'))
-            logger.addHandler(fh)
+        handlers = _build_handlers(logger_name, path)
+
+        # write records on a background thread, the logging call only puts them on a queue
+        if _queue_logging_enabled:
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            handlers = [logging.handlers.QueueHandler(log_queue)]
+            _QUEUE_LISTENERS.append((logger, handlers[0], listener))
+
+        for handler in handlers:
+            logger.addHandler(handler)
 
     logger.setLevel(level.upper() if level is not None else logging.INFO)
 
+    _LOGGER_CACHE[cache_key] = logger
+
     return logger
 
 
+# Loggers created after enabling queue logging write records on a background thread
+def set_queue_logging(enabled=True):
+    global _queue_logging_enabled
+    _queue_logging_enabled = enabled
+
+
+# Writes the queued records and stops the background threads of queue logging, runs at exit.
+# Loggers get their handlers back on the next get_logger call
+def stop_queue_logging():
+    while _QUEUE_LISTENERS:
+        logger, queue_handler, listener = _QUEUE_LISTENERS.pop()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+
+    _LOGGER_CACHE.clear()
+
+
+atexit.register(stop_queue_logging)
+
+
+# Starts a listener that writes the log records of all processes in a pool to this process' handlers,
+# so only one process writes to the rotating file.  Pass listener.queue to init_process_logging in the pool
+# initializer, e.g. ProcessPoolExecutor(initializer=log.init_process_logging, initargs=(listener.queue,)),
+# and call listener.stop() after the pool is shut down.
+def start_process_logging(name=None, path=None):
+    logger_name = name if name is not None else get_log_file_name()
+
+    listener = logging.handlers.QueueListener(multiprocessing.Queue(-1), *_build_handlers(logger_name, path),
+                                              respect_handler_level=True)
+    listener.start()
+
+    return listener
+
+
+# Pool initializer, sends the records of get_logger(name) in the worker process to the listener queue
+def init_process_logging(log_queue, name=None, level=None):
+    logger = logging.getLogger(name if name is not None else get_log_file_name())
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level.upper() if level is not None else logging.INFO)
+
+    # forked workers inherit the parent cache
+    _LOGGER_CACHE.clear()
+    _LOGGER_CACHE[(name, None)] = logger
+
+
 def set_level(logger, level):
     logger.setLevel(level)
 
 
+# Logs msg % args for the first and then every `every` calls with the same key (msg by default).
+# Like logger.log, the message is only formatted when the record is emitted
+def log_sampled(logger, level, msg, *args, every=LOG_SAMPLE_EVERY, key=None):
+    if next(_SAMPLE_COUNTERS[key if key is not None else msg]) % every == 0:
+        logger.log(level, msg, *args)
+
+
+# Logs msg % args at most once per interval seconds for the same key (msg by default),
+# the next logged message reports how many were suppressed
+def log_rate_limited(logger, level, msg, *args, interval=LOG_RATE_LIMIT_INTERVAL, key=None):
+    key = key if key is not None else msg
+    now = time.monotonic()
+
+    with _RATE_LIMIT_LOCK:
+        last_log_time, suppressed_count = _RATE_LIMITS.get(key, (None, 0))
+        if last_log_time is not None and now - last_log_time < interval:
+            _RATE_LIMITS[key] = (last_log_time, suppressed_count + 1)
+            return
+        _RATE_LIMITS[key] = (now, 0)
+
+    if suppressed_count:
+        logger.log(level, msg + " (%d similar messages suppressed)", *args, suppressed_count)
+    else:
+        logger.log(level, msg, *args)
+
+
+# Counts processed items and bytes and logs a summary every interval seconds,
+# e.g. "compress: processed 10,000 files, 3.2 GB in 60s (166.7 files/s)", to get_logger() if logger is None
+class ProgressSummary(object):
+    def __init__(self, name, logger=None, unit='items', interval=PROGRESS_SUMMARY_INTERVAL, level=logging.INFO):
+        self.logger = logger
+        self.name = name
+        self.unit = unit
+        self.interval = interval
+        self.level = level
+        self.count = 0
+        self.byte_count = 0
+        self.start_time = time.monotonic()
+        self.last_log_time = self.start_time
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.log_summary()
+
+    def add(self, count=1, byte_count=0):
+        with self.lock:
+            self.count += count
+            self.byte_count += byte_count
+
+            now = time.monotonic()
+            if now - self.last_log_time < self.interval:
+                return
+            self.last_log_time = now
+
+        self.log_summary()
+
+    def log_summary(self):
+        logger = self.logger if self.logger is not None else get_logger()
+        if not logger.isEnabledFor(self.level):
+            return
+
+        elapsed_time = time.monotonic() - self.start_time
+        rate = self.count / elapsed_time if elapsed_time else 0
+        byte_summary = f", {_format_bytes(self.byte_count)}" if self.byte_count else ''
+
+        logger.log(self.level, "%s: processed %s %s%s in %.0fs (%.1f %s/s)", self.name, f"{self.count:,}",
+                   self.unit, byte_summary, elapsed_time, rate, self.unit)
+
+
+def _format_bytes(byte_count):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if byte_count < 1024 or unit == 'TB':
+            return f"{byte_count:.1f} {unit}" if unit != 'B' else f"{byte_count} B"
+        byte_count /= 1024
+
+
 # Derive log file name in order of 1) main script file name, 2) main module name or 3) current module name
 def get_log_file_name():
+    global _log_file_name
+
+    if _log_file_name is None:
+        _log_file_name = _build_log_file_name()
+
+    return _log_file_name
+
+
+def _build_log_file_name():
     main_module = sys.modules['__main__']
 
     if hasattr(main_module, '__file__'):
@@ -62,6 +224,26 @@ def get_log_file_name():
     return f"{os.path.splitext(base_name)[0]}.log"
 
 
+def _build_handlers(logger_name, path=None):
+    # log to stdout
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    handlers = [ch]
+
+    # log to rotating file, max size is 10MB per file
+    log_file_path = _build_log_file_path(path)
+    if log_file_path is not None:
+        log_file_name = os.path.join(log_file_path, logger_name)
+        fh = logging.handlers.RotatingFileHandler(log_file_name,
+                                                  maxBytes=1024*1024*10,
+                                                  backupCount=5,
+                                                  encoding="utf8")
+        fh.setFormatter(logging.Formatter('%(asctime)s %(process)d [%(levelname)s] %(message)s'))
+        handlers.append(fh)
+
+    return handlers
+
+
 def _build_log_file_path(path=None):
     if path:
         log_path = path
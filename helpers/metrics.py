@@ -0,0 +1,252 @@
+import bisect
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+
+# latency histogram bucket upper bounds in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+STATSD_PORT = 8125
+
+# Metrics reported by the AWS helpers, tagged with service and operation:
+#   aws.calls, aws.errors and aws.retries counters, aws.bytes_sent and aws.bytes_received counters,
+#   aws.latency histogram in seconds.  Collection is disabled until a collector is set,
+#   the botocore hooks then return before doing any work.
+_collector = None
+
+
+# Returns the current collector, None when metrics are disabled
+def get_collector():
+    return _collector
+
+
+def set_collector(collector):
+    global _collector
+    _collector = collector
+
+
+# Collects metrics of the enclosed block, e.g. one job, in a new InMemoryCollector (or the given collector)
+# and restores the previous collector after
+@contextmanager
+def scope(collector=None):
+    previous_collector = _collector
+    collector = collector if collector is not None else InMemoryCollector()
+    set_collector(collector)
+
+    try:
+        yield collector
+    finally:
+        set_collector(previous_collector)
+
+
+def increment(name, value=1, tags=None):
+    if _collector is not None:
+        _collector.increment(name, value, tags)
+
+
+def observe(name, value, tags=None):
+    if _collector is not None:
+        _collector.observe(name, value, tags)
+
+
+# Records the duration of the enclosed block in seconds
+@contextmanager
+def timer(name, tags=None):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start_time, tags)
+
+
+# Registers botocore event hooks that report each API call of a client (or resource.meta.client),
+# error responses are also counted in aws.errors and connection errors only there
+def register_client(aws_client):
+    events = aws_client.meta.events
+    events.register('before-call.*.*', _before_call)
+    events.register('after-call.*.*', _after_call)
+    events.register('after-call-error.*.*', _after_call_error)
+
+    return aws_client
+
+
+class InMemoryCollector(object):
+    def __init__(self, buckets=None):
+        self.buckets = buckets if buckets is not None else LATENCY_BUCKETS
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1, tags=None):
+        key = (name, _to_tag_tuple(tags))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # adds value to a histogram, stored as [bucket counts, sum, count]
+    def observe(self, name, value, tags=None):
+        key = (name, _to_tag_tuple(tags))
+        bucket_index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+            histogram[0][bucket_index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def get_counter(self, name, tags=None):
+        return self.counters.get((name, _to_tag_tuple(tags)), 0)
+
+    # Returns sum of a counter over all tags, or the tags matching filter_tags
+    def get_counter_total(self, name, filter_tags=None):
+        filter_items = set(_to_tag_tuple(filter_tags))
+        return sum(value for (counter_name, tags), value in self.counters.items()
+                   if counter_name == name and filter_items.issubset(tags))
+
+    # Returns {'buckets', 'sum', 'count'} of a histogram, None if nothing was observed
+    def get_histogram(self, name, tags=None):
+        histogram = self.histograms.get((name, _to_tag_tuple(tags)))
+        if histogram is None:
+            return None
+
+        return {'buckets': list(histogram[0]), 'sum': histogram[1], 'count': histogram[2]}
+
+    # Returns metrics in the Prometheus text exposition format, e.g. for the node exporter textfile collector
+    def to_prometheus_text(self):
+        lines = []
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, [list(histogram[0]), histogram[1], histogram[2]])
+                                for key, histogram in self.histograms.items())
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {_to_prometheus_name(name)}_total counter")
+            for (counter_name, tags), value in counters:
+                if counter_name == name:
+                    lines.append(f"{_to_prometheus_name(name)}_total{_to_prometheus_labels(tags)} {value}")
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            metric_name = _to_prometheus_name(name)
+            lines.append(f"# TYPE {metric_name} histogram")
+            for (histogram_name, tags), (bucket_counts, value_sum, count) in histograms:
+                if histogram_name != name:
+                    continue
+
+                cumulative_count = 0
+                for bound, bucket_count in zip(self.buckets + ['+Inf'], bucket_counts):
+                    cumulative_count += bucket_count
+                    labels = _to_prometheus_labels(tags + (('le', str(bound)),))
+                    lines.append(f"{metric_name}_bucket{labels} {cumulative_count}")
+                lines.append(f"{metric_name}_sum{_to_prometheus_labels(tags)} {value_sum}")
+                lines.append(f"{metric_name}_count{_to_prometheus_labels(tags)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_text(self, file_path):
+        with open(file_path, 'w') as fh:
+            fh.write(self.to_prometheus_text())
+
+
+# Sends each metric to a local statsd agent over UDP, tags in the DogStatsD format
+class StatsdCollector(object):
+    def __init__(self, host='127.0.0.1', port=STATSD_PORT, prefix=None):
+        self.address = (host, port)
+        self.prefix = f"{prefix}." if prefix else ''
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def increment(self, name, value=1, tags=None):
+        self._send(name, value, 'c', tags)
+
+    # histogram values are sent as timers in milliseconds
+    def observe(self, name, value, tags=None):
+        self._send(name, round(value * 1000, 3), 'ms', tags)
+
+    def close(self):
+        self.socket.close()
+
+    def _send(self, name, value, metric_type, tags):
+        tag_suffix = f"|#{','.join(f'{key}:{tag_value}' for key, tag_value in _to_tag_tuple(tags))}" if tags else ''
+        try:
+            self.socket.sendto(f"{self.prefix}{name}:{value}|{metric_type}{tag_suffix}".encode('utf-8'), self.address)
+        except OSError:
+            # metrics must never fail the job
+            pass
+
+
+def _before_call(model, params, context, **kwargs):
+    if _collector is not None:
+        context['metrics_start_time'] = time.perf_counter()
+        context['metrics_bytes_sent'] = _get_body_length(params.get('body'))
+        # after-call-error does not get the model
+        context['metrics_tags'] = {'service': model.service_model.endpoint_prefix, 'operation': model.name}
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    collector = _collector
+    if collector is None or 'metrics_start_time' not in context:
+        return
+
+    tags = context['metrics_tags']
+    collector.increment('aws.calls', 1, tags)
+    collector.observe('aws.latency', time.perf_counter() - context['metrics_start_time'], tags)
+
+    if http_response is not None and http_response.status_code >= 300:
+        collector.increment('aws.errors', 1, tags)
+
+    retry_count = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0) if isinstance(parsed, dict) else 0
+    if retry_count:
+        collector.increment('aws.retries', retry_count, tags)
+    if context.get('metrics_bytes_sent'):
+        collector.increment('aws.bytes_sent', context['metrics_bytes_sent'], tags)
+
+    bytes_received = int(http_response.headers.get('content-length', 0) or 0) if http_response is not None else 0
+    if bytes_received:
+        collector.increment('aws.bytes_received', bytes_received, tags)
+
+
+def _after_call_error(exception=None, context=None, **kwargs):
+    collector = _collector
+    if collector is None or context is None or 'metrics_start_time' not in context:
+        return
+
+    tags = context['metrics_tags']
+    collector.increment('aws.errors', 1, tags)
+    collector.observe('aws.latency', time.perf_counter() - context['metrics_start_time'], tags)
+
+
+def _get_body_length(body):
+    if not body:
+        return 0
+
+    # botocore wraps bytes and str bodies in BytesIO
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        try:
+            position = body.tell()
+            length = body.seek(0, 2) - position
+            body.seek(position)
+            return length
+        except (OSError, ValueError):
+            return 0
+
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def _to_tag_tuple(tags):
+    return tuple(sorted(tags.items())) if tags else ()
+
+
+def _to_prometheus_name(name):
+    return name.replace('.', '_').replace('-', '_')
+
+
+def _to_prometheus_labels(tags):
+    if not tags:
+        return ''
+
+    return '{' + ','.join(f'{key}="{value}"' for key, value in tags) + '}'
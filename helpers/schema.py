@@ -0,0 +1,169 @@
+import csv
+import itertools
+import math
+import random
+import re
+from datetime import date, datetime
+from . import file
+from . import util
+
+
+SAMPLE_SIZE = 10000
+DEFAULT_COLUMN_TYPE = 'string'
+MAX_BIGINT = 2 ** 63 - 1
+
+# pairs of types that widen to a type other than string
+TYPE_WIDENING = {
+    ('bigint', 'double'): 'double',
+    ('date', 'timestamp'): 'timestamp',
+}
+
+_BOOLEAN_PATTERN = re.compile(r'(?i)(true|false)$')
+_INTEGER_PATTERN = re.compile(r'[-+]?\d+$')
+_DOUBLE_PATTERN = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}$')
+_TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?(Z|[+-]\d{2}:?\d{2})?$')
+# only values with digits around a date separator are worth a dateutil parse
+_DATE_CANDIDATE_PATTERN = re.compile(r'\d[-/.: ]+\d|\d\s*[A-Za-z]{3}|[A-Za-z]{3}\w*\s+\d')
+
+
+# Returns Glue column list [{'Name', 'Type'}] inferred from a sample of the csv file rows
+# Cost of type inference is bounded by sample_size, rows past max_scan_rows are not read
+def infer_csv_file_columns(input_file_path, delimiter=',', has_header=True, column_mapping=None,
+                           sample_size=SAMPLE_SIZE, max_scan_rows=None, random_seed=None):
+    column_mapping = column_mapping or {}
+
+    with open(input_file_path, 'r', newline='') as fh:
+        csv_reader = csv.reader(fh, delimiter=delimiter)
+
+        header_row = next(csv_reader, None) if has_header else None
+        rows = sample_rows(csv_reader, sample_size, max_scan_rows=max_scan_rows, random_seed=random_seed)
+
+    if header_row is None:
+        num_of_fields = max((len(row) for row in rows), default=0)
+        header_row = [f'col{i}' for i in range(num_of_fields)]
+
+    column_names = [column_mapping.get(col_val, col_val) for col_val in header_row]
+    column_types = [infer_column_type(row[col_index] if col_index < len(row) else None for row in rows)
+                    for col_index in range(len(column_names))]
+
+    return [{'Name': name, 'Type': column_type} for name, column_type in zip(column_names, column_types)]
+
+
+# Returns Glue column list [{'Name', 'Type'}] inferred from a sample of the json lines file records
+# Only sampled lines are decoded, columns are in order of first appearance in the sample
+def infer_json_file_columns(input_file_path, sample_size=SAMPLE_SIZE, max_scan_rows=None, random_seed=None,
+                            json_backend='auto'):
+    json_loads = util.get_json_loads(json_backend)
+
+    with open(input_file_path, 'rb', buffering=file.JSON_BUFFER_SIZE) as fh:
+        lines = sample_rows((line for line in fh if not line.isspace()), sample_size,
+                            max_scan_rows=max_scan_rows, random_seed=random_seed)
+
+    return infer_columns([json_loads(line) for line in lines])
+
+
+# Returns Glue column list [{'Name', 'Type'}] inferred from a list of dictionaries
+def infer_columns(records):
+    column_names = list(dict.fromkeys(key for record in records for key in record))
+
+    return [{'Name': name, 'Type': infer_column_type(record.get(name) for record in records)}
+            for name in column_names]
+
+
+# Returns uniform random sample of at most sample_size rows in their original order,
+# reading the iterable once (reservoir sampling, algorithm L skips rows without drawing for each)
+def sample_rows(rows, sample_size, max_scan_rows=None, random_seed=None):
+    if max_scan_rows is not None:
+        rows = itertools.islice(rows, max_scan_rows)
+
+    indexed_rows = enumerate(rows)
+    reservoir = list(itertools.islice(indexed_rows, sample_size))
+
+    if len(reservoir) == sample_size and sample_size > 0:
+        rng = random.Random(random_seed)
+        weight = math.exp(math.log(1.0 - rng.random()) / sample_size)
+
+        while True:
+            skip = int(math.log(1.0 - rng.random()) / math.log(1.0 - weight)) if weight < 1.0 else 0
+            indexed_row = next(itertools.islice(indexed_rows, skip, None), None)
+            if indexed_row is None:
+                break
+
+            reservoir[rng.randrange(sample_size)] = indexed_row
+            weight *= math.exp(math.log(1.0 - rng.random()) / sample_size)
+
+    return [row for _, row in sorted(reservoir, key=lambda indexed_row: indexed_row[0])]
+
+
+# Returns the narrowest Glue type that holds all values, None and empty values are ignored
+def infer_column_type(values):
+    column_type = None
+
+    for value in values:
+        value_type = infer_value_type(value)
+        if value_type is not None:
+            column_type = widen_type(column_type, value_type)
+
+            # nothing is wider than string, the remaining values do not matter
+            if column_type == DEFAULT_COLUMN_TYPE:
+                break
+
+    return column_type if column_type is not None else DEFAULT_COLUMN_TYPE
+
+
+# Returns Glue type of a csv or json value, or None for an empty value
+def infer_value_type(value):
+    if value is None:
+        return None
+    elif isinstance(value, bool):
+        return 'boolean'
+    elif isinstance(value, int):
+        return 'bigint' if abs(value) <= MAX_BIGINT else DEFAULT_COLUMN_TYPE
+    elif isinstance(value, float):
+        return 'double'
+    elif isinstance(value, datetime):
+        return 'timestamp'
+    elif isinstance(value, date):
+        return 'date'
+    elif not isinstance(value, str):
+        # nested json objects and arrays are kept as json strings
+        return DEFAULT_COLUMN_TYPE
+
+    value = value.strip()
+    if not value:
+        return None
+
+    # cheap regex fast paths in order of frequency, dateutil only for date-like leftovers
+    if _INTEGER_PATTERN.match(value):
+        return 'bigint' if abs(int(value)) <= MAX_BIGINT else DEFAULT_COLUMN_TYPE
+    elif _DOUBLE_PATTERN.match(value):
+        return 'double'
+    elif _BOOLEAN_PATTERN.match(value):
+        return 'boolean'
+    elif _DATE_PATTERN.match(value):
+        return 'date' if _is_iso_date(value) else DEFAULT_COLUMN_TYPE
+    elif _TIMESTAMP_PATTERN.match(value):
+        return 'timestamp'
+    elif _DATE_CANDIDATE_PATTERN.search(value) and util.is_date(value):
+        return 'timestamp'
+
+    return DEFAULT_COLUMN_TYPE
+
+
+# Returns type that holds values of both types
+def widen_type(type1, type2):
+    if type1 is None or type1 == type2:
+        return type2
+    elif type2 is None:
+        return type1
+
+    return TYPE_WIDENING.get(tuple(sorted((type1, type2))), DEFAULT_COLUMN_TYPE)
+
+
+def _is_iso_date(value):
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
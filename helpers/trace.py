@@ -0,0 +1,118 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import simplejson as json
+
+
+# Spans are only recorded while a Tracer is active, e.g. inside `with trace.tracing() as tracer:`,
+# otherwise span() and @traced functions only check a global.
+# Each span is a Chrome trace-event "complete" event on the thread it ran on, so nested calls and threads
+# waiting on each other show up in chrome://tracing or https://ui.perfetto.dev
+_tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+# Records spans of the enclosed block in a new Tracer (or the given tracer) and restores the previous tracer after
+@contextmanager
+def tracing(tracer=None):
+    previous_tracer = _tracer
+    tracer = tracer if tracer is not None else Tracer()
+    set_tracer(tracer)
+
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous_tracer)
+
+
+# Records the enclosed block as a span, args are shown in the trace viewer
+@contextmanager
+def span(name, category='helpers', **args):
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        args['error'] = repr(e)
+        raise
+    finally:
+        tracer.add_span(name, category, start_time, time.perf_counter(), args)
+
+
+# Decorator that records each call as a span named after the module and function, e.g. aws.athena.convert_table
+def traced(func=None, name=None, category='helpers'):
+    if func is None:
+        return functools.partial(traced, name=name, category=category)
+
+    span_name = name if name is not None else f"{func.__module__.replace('helpers.', '', 1)}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracer is None:
+            return func(*args, **kwargs)
+
+        with span(span_name, category):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class Tracer(object):
+    def __init__(self):
+        self.pid = os.getpid()
+        self.start_time = time.perf_counter()
+        self.events = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, name, category, start_time, end_time, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start_time - self.start_time) * 1000000, 3),
+            'dur': round((end_time - start_time) * 1000000, 3),
+            'pid': self.pid,
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = {key: str(value) for key, value in args.items()}
+
+        with self.lock:
+            self.events.append(event)
+            self.thread_names[thread.ident] = thread.name
+
+    # Returns spans with the given name
+    def get_spans(self, name):
+        return [event for event in self.events if event['name'] == name]
+
+    # Returns trace in the Chrome trace-event JSON object format
+    def to_chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+
+        metadata_events = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                           for tid, name in thread_names.items()]
+
+        return {'traceEvents': metadata_events + sorted(events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, file_path):
+        with open(file_path, 'w') as fh:
+            json.dump(self.to_chrome_trace(), fh)
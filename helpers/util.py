@@ -1,10 +1,50 @@
 import base64
 import hashlib
+import io
+import itertools
+import queue
+import re
+import threading
+import warnings
 from dateutil.parser import parse
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 import simplejson as json
 from . import log
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+JSON_BACKENDS = ['orjson', 'simplejson']
+NDJSON_BATCH_SIZE = 1000
+_LONG_DIGITS_PATTERN = re.compile(rb'\d{20}')
+
+# 'iso' is datetime.fromisoformat, the others are strptime formats tried in order, so month first wins ties
+ISO_DATE_FORMAT = 'iso'
+DATE_FORMATS = [
+    '%Y/%m/%d %H:%M:%S', '%Y/%m/%d',
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %I:%M %p', '%m/%d/%Y',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+    '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d', '%Y%m%d%H%M%S',
+    '%d-%b-%Y', '%d %b %Y', '%b %d %Y', '%b %d, %Y', '%B %d, %Y', '%d/%b/%Y:%H:%M:%S %z',
+]
+DATE_SAMPLE_SIZE = 100
+DATE_OUTPUTS = ['datetime', 'numpy']
+
+# boto3 TransferConfig defaults, objects uploaded by s3.upload_file have ETags for these sizes
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+PREFETCH_BUFFER_SIZE = 1
+_PREFETCH_DONE = object()
+
 
 # validators
 def is_date(string):
@@ -60,6 +100,7 @@ def _json_serial(obj):
     raise TypeError("Type {} is not serializable" . format(type(obj)))
 
 
+# Uses the default ', ' and ': ' separators, get_json_dumps is faster for compact JSON
 def convert_json_to_string(json_record):
     return json.dumps(json_record, ensure_ascii=False, default=_json_serial)
 
@@ -71,3 +112,284 @@ def get_md5sum(string_content):
 def get_md5sum_dict(dict_content):
     return hashlib.md5(json.dumps(dict_content, sort_keys=True, ensure_ascii=False,
                                   default=_json_serial).encode('utf-8')).hexdigest()
+
+
+# Streaming MD5, update() with chunks of bytes then read the base64 digest (as get_md5sum) or hex digest
+class Md5Hasher(object):
+    def __init__(self):
+        self.md5 = hashlib.md5()
+
+    def update(self, chunk):
+        self.md5.update(chunk)
+        return self
+
+    def digest(self):
+        return self.md5.digest()
+
+    def base64digest(self):
+        return base64.b64encode(self.md5.digest()).decode('utf-8')
+
+    def hexdigest(self):
+        return self.md5.hexdigest()
+
+
+# Streaming S3 ETag of an object uploaded in parts of part_size bytes when its size reaches multipart_threshold.
+# Multipart ETags are the MD5 of the concatenated part MD5 digests followed by the part count,
+# single part ETags are the MD5 of the content.  Only valid for objects without SSE-KMS/SSE-C encryption.
+class S3ETagHasher(object):
+    def __init__(self, part_size=S3_MULTIPART_CHUNK_SIZE, multipart_threshold=S3_MULTIPART_THRESHOLD):
+        if part_size <= 0:
+            raise ValueError(f"Invalid part size {part_size}, it must be greater than 0")
+
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.md5 = hashlib.md5()
+        self.part_md5 = hashlib.md5()
+        self.part_length = 0
+        self.part_digests = []
+        self.length = 0
+
+    def update(self, chunk):
+        chunk = memoryview(chunk)
+        self.md5.update(chunk)
+        self.length += len(chunk)
+
+        while chunk:
+            part_chunk = chunk[:self.part_size - self.part_length]
+            self.part_md5.update(part_chunk)
+            self.part_length += len(part_chunk)
+            chunk = chunk[len(part_chunk):]
+
+            if self.part_length == self.part_size:
+                self.add_part_digest(self.part_md5.digest())
+                self.part_md5 = hashlib.md5()
+                self.part_length = 0
+
+        return self
+
+    # adds the MD5 digest of the next part, for parts hashed separately e.g. in parallel,
+    # etag() is only valid for hashers fed entirely by update() or entirely by add_part_digest()
+    def add_part_digest(self, part_digest, part_length=None):
+        self.part_digests.append(part_digest)
+        if part_length is not None:
+            self.length += part_length
+
+    # Returns quoted ETag, as returned by S3
+    def etag(self):
+        part_digests = self.part_digests + ([self.part_md5.digest()] if self.part_length else [])
+
+        if self.length < self.multipart_threshold:
+            return f'"{self.md5.hexdigest() if len(part_digests) != 1 else part_digests[0].hex()}"'
+
+        return f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}"'
+
+
+# Returns name of JSON backend, 'auto' picks the fastest installed backend
+def get_json_backend(backend='auto'):
+    if backend is None or backend == 'auto':
+        return 'orjson' if orjson is not None else 'simplejson'
+
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend {backend}.  Supported values are: {JSON_BACKENDS}")
+
+    if backend == 'orjson' and orjson is None:
+        raise ImportError("orjson is not installed")
+
+    return backend
+
+
+# Returns function that decodes a JSON str or utf-8 bytes document
+def get_json_loads(backend='auto'):
+    return _orjson_loads if get_json_backend(backend) == 'orjson' else json.loads
+
+
+# Returns function that encodes a JSON document to compact utf-8 bytes without spaces after ',' and ':',
+# unlike convert_json_to_string, with dates as str(date) and non-ASCII text as is for both backends
+# (orjson writes exponents as 1e20 and NaN as null)
+def get_json_dumps(backend='auto'):
+    return _orjson_dumps if get_json_backend(backend) == 'orjson' else _simplejson_dumps
+
+
+# Writes records as newline delimited JSON to a binary or text file handle, encoding batch_size records
+# per write, returns number of records written
+def write_ndjson(records, fh, json_backend='auto', batch_size=NDJSON_BATCH_SIZE):
+    json_dumps = get_json_dumps(json_backend)
+    is_text = isinstance(fh, io.TextIOBase)
+    record_count = 0
+
+    records = iter(records)
+    for batch in iter(lambda: list(itertools.islice(records, batch_size)), []):
+        buffer = b'\n'.join(map(json_dumps, batch)) + b'\n'
+        fh.write(buffer.decode('utf-8') if is_text else buffer)
+        record_count += len(batch)
+
+    return record_count
+
+
+def _simplejson_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_serial).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    try:
+        return orjson.dumps(obj, default=_json_serial, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # orjson rejects values simplejson encodes, e.g. Decimal and integers over 64 bits
+        return _simplejson_dumps(obj)
+
+
+def _orjson_loads(content):
+    # integers over 64 bits have at least 20 digits, orjson rejects them or converts them to float
+    if _LONG_DIGITS_PATTERN.search(content if isinstance(content, bytes) else content.encode('utf-8')):
+        return json.loads(content)
+
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        # orjson rejects documents simplejson accepts, e.g. NaN
+        return json.loads(content)
+
+
+# Returns the date format (ISO_DATE_FORMAT or one of date_formats) that parses the most values in a sample,
+# or None if no format parses any of them
+def detect_date_format(values, date_formats=None, sample_size=DATE_SAMPLE_SIZE):
+    sample = list(itertools.islice((value for value in values if isinstance(value, str) and value.strip()),
+                                   sample_size))
+    best_format = None
+    best_count = 0
+
+    for date_format in [ISO_DATE_FORMAT] + (date_formats or DATE_FORMATS):
+        date_parser = _build_date_parser(date_format)
+        parsed_count = 0
+        for value in sample:
+            try:
+                date_parser(value)
+                parsed_count += 1
+            except ValueError:
+                pass
+
+        if parsed_count > best_count:
+            best_format = date_format
+            best_count = parsed_count
+            if parsed_count == len(sample):
+                break
+
+    return best_format
+
+
+# Converts a list of date strings to datetimes (output='datetime') or a numpy datetime64[us] array
+# (output='numpy', timezone aware values are converted to UTC).  The format is detected once from a sample
+# unless date_format is given, values it does not parse fall back to dateutil and unparseable values are None.
+# datetime and date values are kept as is, other values that are not strings are unparseable.
+# Returns (converted values, number of values that needed dateutil)
+def convert_dates(values, date_format=None, output='datetime', sample_size=DATE_SAMPLE_SIZE):
+    if output not in DATE_OUTPUTS:
+        raise ValueError(f"Unsupported output {output}.  Supported values are: {DATE_OUTPUTS}")
+    if output == 'numpy' and np is None:
+        raise ImportError("numpy is not installed")
+
+    if date_format is None:
+        date_format = detect_date_format(values, sample_size=sample_size)
+
+    # numpy parses ISO strings without timezone offsets in C, but would read numbers as offsets from the epoch
+    if output == 'numpy' and date_format == ISO_DATE_FORMAT and \
+            all(value is None or isinstance(value, (str, date)) for value in values):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                return np.array(values, dtype='datetime64[us]'), 0
+        except (ValueError, TypeError, UserWarning, DeprecationWarning):
+            pass
+
+    date_parser = _build_date_parser(date_format) if date_format is not None else parse
+    converted_values = []
+    converted_cache = {}
+    slow_path_count = 0
+
+    for value in values:
+        if isinstance(value, date):
+            converted_values.append(value)
+            continue
+
+        if not isinstance(value, str) or not value.strip():
+            converted_values.append(None)
+            continue
+
+        if value not in converted_cache:
+            try:
+                converted_cache[value] = (date_parser(value), date_format is None)
+            except (ValueError, OverflowError):
+                try:
+                    converted_cache[value] = (parse(value), True)
+                except (ValueError, OverflowError):
+                    converted_cache[value] = (None, True)
+
+        converted_value, slow_path = converted_cache[value]
+        converted_values.append(converted_value)
+        slow_path_count += slow_path
+
+    if output == 'numpy':
+        return np.array([_to_naive_utc(value) for value in converted_values], dtype='datetime64[us]'), \
+               slow_path_count
+
+    return converted_values, slow_path_count
+
+
+def _build_date_parser(date_format):
+    if date_format == ISO_DATE_FORMAT:
+        return datetime.fromisoformat
+
+    return lambda value: datetime.strptime(value, date_format)
+
+
+def _to_naive_utc(value):
+    if getattr(value, 'tzinfo', None) is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return value
+
+
+# Iterates iterable in a background thread that keeps up to buffer_size items ready ahead of the consumer,
+# e.g. so the next pages of a paginator are fetched while the current page is processed.
+# Exceptions of the iterable are raised in the consumer.  Closing the generator stops the background thread
+# after its current item.
+def prefetch(iterable, buffer_size=PREFETCH_BUFFER_SIZE):
+    item_queue = queue.Queue(maxsize=buffer_size)
+    stop_event = threading.Event()
+
+    def _put(item):
+        while not stop_event.is_set():
+            try:
+                item_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not _put((item, None)):
+                    return
+            _put((_PREFETCH_DONE, None))
+        except BaseException as e:
+            _put((_PREFETCH_DONE, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    threading.Thread(target=_produce, name='prefetch', daemon=True).start()
+
+    try:
+        while True:
+            item, error = item_queue.get()
+            if item is _PREFETCH_DONE:
+                if error is not None:
+                    raise error
+                return
+
+            yield item
+    finally:
+        stop_event.set()
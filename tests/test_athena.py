@@ -0,0 +1,420 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from botocore.exceptions import ClientError, EndpointConnectionError
+from helpers import metrics
+from helpers.aws import athena, s3
+
+BUCKET = 'test_bucket'
+
+
+# answers batch_get_query_execution like Athena, each query is done after a number of checks
+class FakeAthenaClient(object):
+    def __init__(self, poll_count=1):
+        self.poll_count = poll_count
+        self.poll_counts = {}
+        self.batch_sizes = []
+        self.throttle_count = 0
+        self.connection_error_count = 0
+        self.start_throttle_count = 0
+        self.started = []
+        self.result_pages = []
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, **kwargs):
+        with self.lock:
+            if self.start_throttle_count:
+                self.start_throttle_count -= 1
+                raise ClientError({'Error': {'Code': 'TooManyRequestsException', 'Message': 'Too many queries'}},
+                                  'StartQueryExecution')
+
+            query_execution_id = f'query-{len(self.started)}'
+            self.started.append(QueryString)
+            self.start_kwargs = kwargs
+            self.poll_counts[query_execution_id] = 0
+            self.max_running = max(self.max_running, len([count for count in self.poll_counts.values()
+                                                          if count < self.poll_count]))
+
+        return {'QueryExecutionId': query_execution_id}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        with self.lock:
+            if self.throttle_count:
+                self.throttle_count -= 1
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                                  'BatchGetQueryExecution')
+            if self.connection_error_count:
+                self.connection_error_count -= 1
+                raise EndpointConnectionError(endpoint_url='https://athena.us-east-1.amazonaws.com')
+
+            self.batch_sizes.append(len(QueryExecutionIds))
+            query_executions = []
+            unprocessed = []
+            for query_execution_id in QueryExecutionIds:
+                if query_execution_id.startswith('missing'):
+                    unprocessed.append({'QueryExecutionId': query_execution_id, 'ErrorCode': 'INVALID_INPUT'})
+                    continue
+
+                self.poll_counts[query_execution_id] = self.poll_counts.get(query_execution_id, 0) + 1
+                state = 'SUCCEEDED' if self.poll_counts[query_execution_id] >= self.poll_count else 'RUNNING'
+                query_executions.append({'QueryExecutionId': query_execution_id,
+                                         'StatementType': 'DML',
+                                         'Status': {'State': state},
+                                         'Statistics': {'EngineExecutionTimeInMillis': 10, 'DataScannedInBytes': 100},
+                                         'ResultConfiguration': {
+                                             'OutputLocation': f's3://{BUCKET}/athena/{query_execution_id}.csv'}})
+
+        return {'QueryExecutions': query_executions, 'UnprocessedQueryExecutionIds': unprocessed}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': {'QueryExecutionId': QueryExecutionId,
+                                   'StatementType': 'DML',
+                                   'Status': {'State': 'SUCCEEDED'},
+                                   'ResultConfiguration': {
+                                       'OutputLocation': f's3://{BUCKET}/athena/{QueryExecutionId}.csv'}}}
+
+    def get_paginator(self, operation_name):
+        return FakeResultPaginator(self.result_pages)
+
+    def get_query_results(self, QueryExecutionId, MaxResults):
+        return next(FakeResultPaginator(self.result_pages[:1]).paginate(QueryExecutionId))
+
+
+# tables with an UpdateTime that tests can change
+class FakeGlueClient(object):
+    def __init__(self, update_times):
+        self.update_times = update_times
+        self.exceptions = self
+
+    def get_table(self, DatabaseName, Name):
+        return {'Table': {'Name': Name, 'UpdateTime': self.update_times[f'{DatabaseName}.{Name}']}}
+
+
+# pages of GetQueryResults rows, values of None are returned without VarCharValue like Athena nulls
+class FakeResultPaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, QueryExecutionId, PaginationConfig=None):
+        for columns, rows in self.pages:
+            # columns are names of varchar columns or (name, type) tuples
+            column_info = [{'Name': column, 'Type': 'varchar'} if isinstance(column, str) else
+                           {'Name': column[0], 'Type': column[1]} for column in columns]
+            yield {'ResultSet': {
+                'ResultSetMetadata': {'ColumnInfo': column_info},
+                'Rows': [{'Data': [{'VarCharValue': value} if value is not None else {} for value in row]}
+                         for row in rows]}}
+
+
+def test_query_poller():
+    athena_client = FakeAthenaClient(poll_count=3)
+    athena_client.throttle_count = 1
+    poller = athena.QueryPoller(min_interval=0.01, max_interval=0.05, athena_client=athena_client)
+
+    futures = [poller.submit(f'query-{i}') for i in range(120)]
+    missing_future = poller.submit('missing-query')
+
+    assert [future.result(10)['Status']['State'] for future in futures] == ['SUCCEEDED'] * 120
+    assert missing_future.result(10)['Status']['State'] == 'FAILED'
+    assert max(athena_client.batch_sizes) == athena.POLL_BATCH_SIZE
+    assert len(athena_client.batch_sizes) < 120
+    assert poller.get_pending_count() == 0
+
+    # thread exits when idle and restarts on the next query
+    thread = poller.thread
+    if thread is not None:
+        thread.join(1)
+    assert poller.thread is None
+    assert poller.wait('query-0')['Status']['State'] == 'SUCCEEDED'
+
+
+def test_query_poller_timeout():
+    poller = athena.QueryPoller(min_interval=0.01, max_interval=0.05, athena_client=FakeAthenaClient(poll_count=1000))
+
+    with pytest.raises(TimeoutError):
+        poller.wait('query-0', timeout=0.1)
+    assert poller.get_pending_count() == 0
+
+
+def test_query_poller_connection_errors():
+    athena_client = FakeAthenaClient(poll_count=2)
+    athena_client.connection_error_count = athena.POLL_MAX_ERRORS - 1
+    poller = athena.QueryPoller(min_interval=0.01, max_interval=0.02, athena_client=athena_client)
+
+    # transient errors are retried
+    futures = [poller.submit(f'query-{i}') for i in range(3)]
+    assert [future.result(10)['Status']['State'] for future in futures] == ['SUCCEEDED'] * 3
+
+    # queries fail after POLL_MAX_ERRORS consecutive errors
+    athena_client.connection_error_count = 1000
+    with pytest.raises(EndpointConnectionError):
+        poller.wait('query-5', timeout=10)
+    assert athena_client.connection_error_count == 1000 - athena.POLL_MAX_ERRORS
+
+
+def test_query_poller_timeout_with_other_waiter():
+    athena_client = FakeAthenaClient(poll_count=10)
+    poller = athena.QueryPoller(min_interval=0.01, max_interval=0.02, athena_client=athena_client)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other_waiter = executor.submit(poller.wait, 'query-0')
+        time.sleep(0.01)
+        with pytest.raises(TimeoutError):
+            poller.wait('query-0', timeout=0.02)
+
+        # the query is still polled for the other waiter
+        assert poller.get_pending_count() == 1
+        assert other_waiter.result(10)['Status']['State'] == 'SUCCEEDED'
+
+
+def test_poll_interval():
+    poller = athena.QueryPoller(min_interval=0.5, max_interval=10, athena_client=FakeAthenaClient())
+
+    assert poller._get_poll_interval(0) == 0.5
+    assert poller._get_poll_interval(20) == 2
+    assert poller._get_poll_interval(600) == 10
+    assert poller._get_poll_interval(2, expected_runtime=6) == 4
+
+
+def test_run_query_with_poller():
+    athena_client = FakeAthenaClient(poll_count=2)
+    poller = athena.QueryPoller(min_interval=0.01, athena_client=athena_client)
+
+    query_resp = athena.run_query('test_db', 'select 1', workgroup='primary', athena_client=athena_client,
+                                  poller=poller)
+
+    assert query_resp['Status']['State'] == 'SUCCEEDED'
+    assert athena_client.poll_counts == {'query-0': 2}
+
+
+def test_query_scheduler():
+    athena_client = FakeAthenaClient(poll_count=2)
+    athena_client.start_throttle_count = 2
+    poller = athena.QueryPoller(min_interval=0.01, max_interval=0.05, athena_client=athena_client)
+    scheduler = athena.QueryScheduler(max_concurrent=3, retry_delay=0.01, poller=poller, athena_client=athena_client)
+
+    with metrics.scope() as collector:
+        futures = [scheduler.submit('test_db', f'select {i}', workgroup='primary', priority=i % 2) for i in range(12)]
+        assert [future.result(10)['Status']['State'] for future in futures] == ['SUCCEEDED'] * 12
+
+    assert athena_client.max_running == 3
+    assert collector.get_counter('athena.scheduler.throttled', {'workgroup': 'primary'}) == 2
+    assert collector.get_histogram('athena.scheduler.wait_time', {'workgroup': 'primary'})['count'] == 12
+    assert scheduler.get_stats() == {'queued': 0, 'in_flight': {}}
+
+    # run_query waits on the scheduler
+    query_resp = athena.run_query('test_db', 'select 1', workgroup='primary', scheduler=scheduler)
+    assert query_resp['Status']['State'] == 'SUCCEEDED'
+
+
+def test_query_scheduler_priority():
+    athena_client = FakeAthenaClient(poll_count=2)
+    poller = athena.QueryPoller(min_interval=0.01, athena_client=athena_client)
+    scheduler = athena.QueryScheduler(workgroup_limits={'etl': 2}, poller=poller, athena_client=athena_client)
+
+    # queue all queries before the scheduler thread can start any
+    with scheduler.condition:
+        futures = [scheduler.submit('test_db', f'select {i}', workgroup='etl', priority=i % 2) for i in range(6)]
+    for future in futures:
+        future.result(10)
+
+    assert athena_client.started == ['select 1', 'select 3', 'select 5', 'select 0', 'select 2', 'select 4']
+    assert athena_client.max_running == 2
+
+
+def test_query_scheduler_failed_query():
+    athena_client = FakeAthenaClient()
+    poller = athena.QueryPoller(min_interval=0.01, athena_client=athena_client)
+    scheduler = athena.QueryScheduler(max_retries=0, poller=poller, athena_client=athena_client)
+
+    with pytest.raises(ValueError):
+        scheduler.submit('test_db', 'select 1').result(10)
+
+    athena_client.start_throttle_count = 1
+    with pytest.raises(ClientError):
+        scheduler.submit('test_db', 'select 1', workgroup='primary').result(10)
+
+
+def test_yield_query_results():
+    athena_client = FakeAthenaClient()
+
+    # data rows that look like the header are kept
+    athena_client.result_pages = [(['id', 'name'], [['id', 'name'], ['1', 'a'], ['id', 'name']]),
+                                  (['id', 'name'], [['2', None]])]
+    assert athena.get_query_results('query-0', athena_client=athena_client) == [
+        {'id': '1', 'name': 'a'}, {'id': 'id', 'name': 'name'}, {'id': '2', 'name': None}]
+    assert athena.get_query_results('query-0', athena_client=athena_client, prefetch_pages=2) == [
+        {'id': '1', 'name': 'a'}, {'id': 'id', 'name': 'name'}, {'id': '2', 'name': None}]
+
+    # show partitions has no header row
+    athena_client.result_pages = [(['partition'], [['dt=2020-01-01'], ['dt=2020-01-02']])]
+    assert athena.get_query_results('query-0', max_results=1, athena_client=athena_client) == [
+        {'partition': 'dt=2020-01-01'}]
+
+
+def test_yield_query_results_stream_output(s3_client):
+    athena_client = FakeAthenaClient()
+    rows = [{'id': str(i), 'name': f'name, {i}' if i % 3 else None} for i in range(1000)]
+    csv_rows = ['"id","name"'] + [f'"{row["id"]}",' + (f'"{row["name"]}"' if row['name'] else '') for row in rows]
+    s3.write_file(BUCKET, 'athena/query-1.csv', '\n'.join(csv_rows) + '\n')
+
+    assert athena.get_query_results('query-1', athena_client=athena_client, stream_output=True) == rows
+    assert athena.get_query_results('query-1', max_results=10, athena_client=athena_client, stream_output=True,
+                                    max_workers=4) == rows[:10]
+
+    assert list(athena.yield_query_results('query-1', athena_client=athena_client, stream_output=True,
+                                           delete_output=True)) == rows
+    assert not s3.prefix_exists(BUCKET, 'athena/query-1.csv')
+
+
+def test_open_file_stream(s3_client):
+    content = bytes(range(256)) * 1000
+    s3_client.put_object(Bucket=BUCKET, Key='stream/test.bin', Body=content)
+
+    with s3.open_file_stream(BUCKET, 'stream/test.bin') as fh:
+        assert fh.read() == content
+
+    with s3.open_file_stream(BUCKET, 'stream/test.bin', max_workers=4, chunk_size=10000) as fh:
+        assert fh.read(5) == content[:5]
+        assert fh.read() == content[5:]
+
+
+TYPED_COLUMNS = [('id', 'bigint'), ('amount', 'decimal'), ('ratio', 'double'), ('active', 'boolean'),
+                 ('day', 'date'), ('created', 'timestamp'), 'name']
+TYPED_HEADER = ['id', 'amount', 'ratio', 'active', 'day', 'created', 'name']
+
+
+def test_yield_query_result_batches():
+    athena_client = FakeAthenaClient()
+    athena_client.result_pages = [(TYPED_COLUMNS, [TYPED_HEADER,
+                                                   ['1', '1.50', '0.5', 'true', '2020-01-02', '2020-01-02 03:04:05.600',
+                                                    'a']]),
+                                  (TYPED_COLUMNS, [['2', None, None, 'false', None, None, ''],
+                                                   ['3', '2', '1', 'false', '2020-01-03', '2020-01-03 00:00:00.000',
+                                                    None]])]
+
+    batches = list(athena.yield_query_result_batches('query-0', batch_size=2, athena_client=athena_client,
+                                                     prefetch_pages=1))
+    assert batches == [
+        [(1, Decimal('1.50'), 0.5, True, date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5, 600000), 'a'),
+         (2, None, None, False, None, None, '')],
+        [(3, Decimal('2'), 1.0, False, date(2020, 1, 3), datetime(2020, 1, 3), None)]]
+
+    column_batch = next(athena.yield_query_result_batches('query-0', output='columns', max_results=2,
+                                                          athena_client=athena_client))
+    assert column_batch['id'] == [1, 2]
+    assert column_batch['name'] == ['a', '']
+
+    with pytest.raises(ValueError):
+        next(athena.yield_query_result_batches('query-0', output='dict', athena_client=athena_client))
+
+    np = pytest.importorskip('numpy')
+
+    numpy_batch = next(athena.yield_query_result_batches('query-0', output='numpy', athena_client=athena_client))
+    assert numpy_batch['id'].dtype == np.int64
+    assert numpy_batch['ratio'].dtype == np.float64 and np.isnan(numpy_batch['ratio'][1])
+    assert numpy_batch['created'].dtype == np.dtype('datetime64[ms]') and np.isnat(numpy_batch['created'][1])
+    assert numpy_batch['amount'].dtype == object
+
+
+def test_yield_query_result_batches_stream_output(s3_client):
+    athena_client = FakeAthenaClient()
+    athena_client.result_pages = [(TYPED_COLUMNS, [TYPED_HEADER])]
+    s3.write_file(BUCKET, 'athena/query-2.csv', '\n'.join([
+        ','.join(f'"{column_name}"' for column_name in TYPED_HEADER),
+        '"1","1.50","0.5","true","2020-01-02","2020-01-02 03:04:05.600","a, b"',
+        '"2",,,"false",,,',
+    ]) + '\n')
+
+    batches = list(athena.yield_query_result_batches('query-2', athena_client=athena_client, stream_output=True))
+    assert batches == [[(1, Decimal('1.50'), 0.5, True, date(2020, 1, 2), datetime(2020, 1, 2, 3, 4, 5, 600000),
+                         'a, b'),
+                        (2, None, None, False, None, None, None)]]
+
+
+def test_normalize_query():
+    query = """-- daily report
+        WITH recent AS (SELECT * FROM  Sales.Orders WHERE dt > '2020-01-01 -- Not a comment')
+        select r.id ,  c.name from recent r
+          JOIN "customers" c on r.cid = c.id cross join unnest(r.items) as t(item);"""
+
+    assert athena.normalize_query(query) == ("with recent as(select * from sales.orders where dt>'2020-01-01 -- Not a "
+                                             "comment')select r.id,c.name from recent r join \"customers\" c on "
+                                             "r.cid=c.id cross join unnest(r.items)as t(item)")
+    assert athena.normalize_query('SELECT  1 /* note */\n;') == athena.normalize_query('select 1')
+
+    # whitespace in string literals is significant
+    assert athena.normalize_query("select * from t where name = 'a  b'") == "select * from t where name='a  b'"
+    cache = athena.QueryResultCache(glue_client=FakeGlueClient({}), athena_client=FakeAthenaClient())
+    cache_keys = {cache.get_cache_key('test_db', f"select * from t where name = '{name}'")
+                  for name in ('a b', 'a  b', 'a\tb')}
+    assert len(cache_keys) == 3
+    assert athena.get_query_tables(query, 'test_db') == [('sales', 'orders'), ('test_db', 'customers')]
+
+    # comma separated from lists with aliases and subqueries
+    assert athena.get_query_tables('select * from t1, t2', 'd') == [('d', 't1'), ('d', 't2')]
+    assert athena.get_query_tables('select * from db.t1 a, db.t2 as b where a.id = b.id', 'd') == [
+        ('db', 't1'), ('db', 't2')]
+    assert athena.get_query_tables('select * from (select * from t1, t2) s, t3 join t4 on s.id = t4.id', 'd') == [
+        ('d', 't1'), ('d', 't2'), ('d', 't3'), ('d', 't4')]
+
+    # tables that cannot be parsed are unknown
+    assert athena.get_query_tables('select * from table(sequence(1, 2))', 'd') is None
+    assert athena.get_query_tables('select * from (t1 join t2 on t1.id = t2.id)', 'd') is None
+
+
+def test_query_result_cache(s3_client, tmp_path):
+    athena_client = FakeAthenaClient()
+    glue_client = FakeGlueClient({'test_db.orders': datetime(2020, 1, 1)})
+    poller = athena.QueryPoller(min_interval=0.01, athena_client=athena_client)
+    for i in range(5):
+        s3.write_file(BUCKET, f'athena/query-{i}.csv', '"id"\n"1"\n"2"\n')
+
+    cache = athena.QueryResultCache(cache_path=str(tmp_path), copy_results=True, glue_client=glue_client,
+                                    athena_client=athena_client)
+
+    with metrics.scope() as collector:
+        query_resp = cache.run_query('test_db', 'select id from orders', workgroup='primary', poller=poller,
+                                     result_reuse_max_age=60)
+        assert athena_client.start_kwargs['ResultReuseConfiguration'] == {
+            'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': 60}}
+
+        # same query in another format and a new cache instance reading the same cache path
+        cache = athena.QueryResultCache(cache_path=str(tmp_path), copy_results=True, glue_client=glue_client,
+                                        athena_client=athena_client)
+        assert cache.run_query('test_db', 'SELECT id\n  FROM orders;', workgroup='primary', poller=poller) == query_resp
+        assert list(cache.yield_query_results('test_db', 'select id from orders', workgroup='primary')) == [
+            {'id': '1'}, {'id': '2'}]
+
+        # other workgroups and updated tables run the query again
+        cache.run_query('test_db', 'select id from orders', workgroup='etl', poller=poller)
+        glue_client.update_times['test_db.orders'] = datetime(2020, 1, 2)
+        assert cache.run_query('test_db', 'select id from orders', workgroup='primary',
+                               poller=poller)['QueryExecutionId'] == 'query-2'
+
+        # queries with unknown tables are not cached
+        for _ in range(2):
+            cache.run_query('test_db', 'select * from table(sequence(1, 2))', workgroup='primary', poller=poller)
+
+    assert athena_client.started == ['select id from orders'] * 3 + ['select * from table(sequence(1, 2))'] * 2
+    assert collector.get_counter('athena.result_cache.hits') == 2
+    assert collector.get_counter('athena.result_cache.misses') == 3
+    assert collector.get_counter('athena.result_cache.skipped') == 2
+
+
+def test_query_result_cache_expired_output(s3_client):
+    athena_client = FakeAthenaClient()
+    cache = athena.QueryResultCache(max_age=60, glue_client=FakeGlueClient({}), athena_client=athena_client)
+    query_resp = {'QueryExecutionId': 'query-9', 'Status': {'State': 'SUCCEEDED'},
+                  'ResultConfiguration': {'OutputLocation': f's3://{BUCKET}/athena/query-9.csv'}}
+
+    cache.put('test_db', 'select 1', query_resp)
+    assert cache.get('test_db', 'select 1') is None
+
+    s3.write_file(BUCKET, 'athena/query-9.csv', '"_col0"\n"1"\n')
+    assert cache.get('test_db', 'select 1') == query_resp
+    assert cache.get('test_db', 'select 2') is None
@@ -0,0 +1,65 @@
+import os
+import pytest
+from helpers import dedupe
+
+
+def _build_records(count):
+    return [{'id': i % (count // 2), 'name': f'name {i % (count // 2)}'} for i in range(count)]
+
+
+def test_filter_unique():
+    records = _build_records(5000)
+    expected = records[:2500]
+
+    assert list(dedupe.filter_unique(records)) == expected
+    assert list(dedupe.filter_unique(records, fingerprint_bits=128)) == expected
+
+    with pytest.raises(ValueError, match='Unsupported fingerprint_bits'):
+        dedupe.Deduplicator(fingerprint_bits=32)
+
+
+@pytest.mark.parametrize('fingerprint_bits', [64, 128])
+@pytest.mark.parametrize('bloom_filter', [True, False])
+def test_filter_unique_spill(tmp_path, fingerprint_bits, bloom_filter):
+    records = _build_records(5000)
+
+    with dedupe.Deduplicator(fingerprint_bits=fingerprint_bits, max_memory_bytes=16 * 1024, bloom_filter=bloom_filter,
+                             spill_dir=str(tmp_path)) as deduplicator:
+        assert list(deduplicator.filter_unique(records)) == records[:2500]
+        assert deduplicator.runs and len(os.listdir(str(tmp_path))) == len(deduplicator.runs)
+        assert deduplicator.record_count == 5000 and deduplicator.unique_count == 2500
+        assert deduplicator.memory_bytes() <= 16 * 1024 + sum(run.memory_bytes() for run in deduplicator.runs)
+
+    assert not os.listdir(str(tmp_path))
+
+
+@pytest.mark.parametrize('fingerprint_bits', [64, 128])
+def test_filter_unique_merge_runs(tmp_path, monkeypatch, fingerprint_bits):
+    monkeypatch.setattr(dedupe, 'DEDUPE_WRITE_BATCH_SIZE', 100)
+    records = _build_records(20000)
+    spill_count = [0]
+
+    with dedupe.Deduplicator(fingerprint_bits=fingerprint_bits, max_memory_bytes=16 * 1024,
+                             spill_dir=str(tmp_path)) as deduplicator:
+        spill = deduplicator._spill
+
+        def _count_spill():
+            spill_count[0] += 1
+            spill()
+
+        monkeypatch.setattr(deduplicator, '_spill', _count_spill)
+        assert list(deduplicator.filter_unique(records)) == records[:10000]
+        assert spill_count[0] > dedupe.DEDUPE_MAX_RUNS
+        assert 0 < len(deduplicator.runs) <= dedupe.DEDUPE_MAX_RUNS
+        assert len(os.listdir(str(tmp_path))) == len(deduplicator.runs)
+        assert sum(len(run) for run in deduplicator.runs) + len(deduplicator.table) == 10000
+
+    assert not os.listdir(str(tmp_path))
+
+
+def test_memory_per_record():
+    deduplicator = dedupe.Deduplicator()
+    list(deduplicator.filter_unique({'id': i} for i in range(10000)))
+
+    assert len(deduplicator.table) == 10000
+    assert deduplicator.memory_per_record() < 16
@@ -1,6 +1,11 @@
+import gzip
+import io
 import pytest
 import os
-from helpers import file
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from helpers import file, util
 
 
 def test_local_path_exists():
@@ -91,3 +96,342 @@ def test_compress_file():
             os.remove(zipped_name)
 
 
+def test_gzip_file_parallel(tmp_path):
+    content = b''.join(b'This is line %d\n' % i for i in range(100000))
+    input_path = tmp_path / 'test.txt'
+    input_path.write_bytes(content)
+
+    gzipped_name = file.gzip_file(str(input_path), max_workers=4, block_size=64 * 1024)
+    assert gzipped_name == f"{input_path}.gz"
+    with gzip.open(gzipped_name, 'rb') as fh:
+        assert fh.read() == content
+
+    input_path.write_bytes(b'')
+    gzipped_name = file.gzip_file(str(input_path), max_workers=4)
+    with gzip.open(gzipped_name, 'rb') as fh:
+        assert fh.read() == b''
+
+
+def test_split_file_obj(tmp_path):
+    content = b'line 1\nline 22\nline 333\nline 4444\nline 5'
+    output_path = str(tmp_path / 'test.txt')
+
+    output_paths = file.split_file_obj(io.BytesIO(content), output_path, 2, buffer_size=4)
+    assert output_paths == [str(tmp_path / f'test_{i:08d}.txt') for i in range(3)]
+    assert [open(p, 'rb').read() for p in output_paths] == [b'line 1\nline 22\n', b'line 333\nline 4444\n',
+                                                            b'line 5']
+
+    output_paths = file.split_file_obj(io.BytesIO(content), output_path, max_bytes_per_file=16, compress=True)
+    assert output_paths == [str(tmp_path / f'test_{i:08d}.txt.gz') for i in range(3)]
+    assert [gzip.open(p, 'rb').read() for p in output_paths] == [b'line 1\nline 22\n', b'line 333\n',
+                                                                 b'line 4444\nline 5']
+
+    assert file.split_file_obj(io.BytesIO(b''), output_path, 2) == []
+
+    with pytest.raises(ValueError):
+        file.split_file_obj(io.BytesIO(content), output_path)
+    with pytest.raises(ValueError):
+        file.split_file_obj(io.BytesIO(content), output_path, 0)
+
+
+def test_yield_zip_members(tmp_path):
+    zip_path = str(tmp_path / 'test.zip')
+    with zipfile.ZipFile(zip_path, 'w') as zipped_file:
+        zipped_file.writestr('a.csv', 'a,b\n1,2\n')
+        zipped_file.writestr('folder/b.csv', 'c,d\n3,4\n')
+        zipped_file.writestr('c.txt', 'text')
+
+    assert [(name, fh.read()) for name, fh in file.yield_zip_members(zip_path, '*.csv')] == \
+           [('a.csv', b'a,b\n1,2\n'), ('folder/b.csv', b'c,d\n3,4\n')]
+
+    for max_workers in (None, 2):
+        extracted_paths = []
+        for name, extracted_path in file.yield_zip_members(zip_path, lambda name: name != 'c.txt', extract=True,
+                                                           max_workers=max_workers):
+            assert file.local_path_exists(extracted_path)
+            extracted_paths.append(extracted_path)
+
+        assert extracted_paths == [str(tmp_path / 'a.csv'), str(tmp_path / 'folder/b.csv')]
+        assert not any(file.local_path_exists(p) for p in extracted_paths)
+
+    # members extracted ahead of an early exit are deleted
+    members = file.yield_zip_members(zip_path, extract=True, max_workers=3)
+    next(members)
+    members.close()
+    assert file.list_files_recursively(str(tmp_path), suffix='.csv') == []
+
+    assert file.decompress_file(zip_path) == [str(tmp_path / 'a.csv'), str(tmp_path / 'folder/b.csv'),
+                                              str(tmp_path / 'c.txt')]
+    assert open(tmp_path / 'c.txt').read() == 'text'
+
+
+def test_yield_csv_file_batch(tmp_path):
+    input_path = str(tmp_path / 'test.csv')
+    with open(input_path, 'w') as fh:
+        fh.write('id,name,amount\n1,a,1.5\n2,,2.5\n3,c\n\n4,d,\n')
+
+    errors = []
+
+    def _handle_error(line_number, row, e, **kwargs):
+        errors.append((line_number, row, type(e)))
+
+    kwargs = {'column_mapping': {'name': 'full_name'}, 'data_exception_handler': _handle_error,
+              'data_exception_kwargs': {}}
+
+    assert file.get_csv_file_header(input_path, column_mapping={'name': 'full_name'}) == ['id', 'full_name', 'amount']
+    assert list(file.yield_csv_file_batch(input_path, batch_size=2, **kwargs)) == \
+           [[('1', 'a', '1.5'), ('2', None, '2.5')], [('4', 'd', None)]]
+    assert errors == [(4, ['3', 'c'], IndexError)]
+
+    dict_rows = list(file.yield_csv_file_row(input_path, **kwargs))
+    assert list(file.yield_csv_file_batch(input_path, output='columns', **kwargs)) == \
+           [{col_name: [row[col_name] for row in dict_rows] for col_name in dict_rows[0]}]
+
+    with pytest.raises(IndexError):
+        list(file.yield_csv_file_batch(input_path))
+
+
+def test_yield_csv_file_batch_numpy(tmp_path):
+    pytest.importorskip('numpy')
+
+    input_path = str(tmp_path / 'test.csv')
+    with open(input_path, 'w') as fh:
+        fh.write('id,name\n1,a\n2,\n')
+
+    batches = list(file.yield_csv_file_batch(input_path, output='numpy'))
+    assert len(batches) == 1
+    assert batches[0]['id'].tolist() == ['1', '2']
+    assert batches[0]['name'].tolist() == ['a', None]
+
+
+def test_yield_csv_file_batch_parallel(tmp_path):
+    input_path = str(tmp_path / 'test.csv')
+    with open(input_path, 'w') as fh:
+        fh.write('id,name,amount\n')
+        for i in range(1000):
+            fh.write(f'{i},"name, {i}",{"" if i % 7 else i * 1.5}\n' if i != 500 else '500,short\n')
+
+    errors = []
+
+    def _handle_error(line_number, row, e, **kwargs):
+        errors.append((line_number, row, type(e)))
+
+    kwargs = {'batch_size': 100, 'column_mapping': {'name': 'full_name'}, 'data_exception_handler': _handle_error,
+              'data_exception_kwargs': {}}
+
+    serial_batches = list(file.yield_csv_file_batch(input_path, **kwargs))
+    serial_errors = errors[:]
+    errors.clear()
+
+    parallel_batches = list(file.yield_csv_file_batch_parallel(input_path, max_workers=2, chunk_size=1000, **kwargs))
+    assert [row for batch in parallel_batches for row in batch] == [row for batch in serial_batches for row in batch]
+    assert errors == serial_errors == [(502, ['500', 'short'], IndexError)]
+
+    unordered_batches = file.yield_csv_file_batch_parallel(input_path, max_workers=2, chunk_size=1000,
+                                                           ordered=False, **kwargs)
+    assert sorted(row for batch in unordered_batches for row in batch) == \
+           sorted(row for batch in serial_batches for row in batch)
+
+    # without safe_mode the line numbers come from the workers
+    for ordered in (True, False):
+        errors.clear()
+        unsafe_batches = file.yield_csv_file_batch_parallel(input_path, max_workers=2, chunk_size=1000,
+                                                            ordered=ordered, safe_mode=False, **kwargs)
+        assert sorted(row for batch in unsafe_batches for row in batch) == \
+               sorted(row for batch in serial_batches for row in batch)
+        assert errors == serial_errors
+
+    # quoted values with embedded newlines fall back to serial parsing
+    with open(input_path, 'w') as fh:
+        fh.write('id,comment\n')
+        for i in range(100):
+            fh.write(f'{i},"line 1\nline 2"\n')
+
+    parallel_rows = [row for batch in file.yield_csv_file_batch_parallel(input_path, max_workers=2, chunk_size=100)
+                     for row in batch]
+    assert parallel_rows == [(str(i), 'line 1\nline 2') for i in range(100)]
+
+
+def test_yield_json_file_row(tmp_path):
+    input_path = str(tmp_path / 'test.json')
+    with open(input_path, 'w') as fh:
+        fh.write('{"id": 1, "name": "a"}\n{"id": 2, "name": "\\u00e9"}\nbad\n'
+                 '{"id": 3, "big": 123456789012345678901234567890}\n')
+
+    errors = []
+
+    def _handle_error(line_number, row, e, **kwargs):
+        errors.append((line_number, row))
+
+    expected = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'é'}, {'id': 3, 'big': 123456789012345678901234567890}]
+
+    assert file.get_json_file_columns(input_path) == ['id', 'name']
+    assert list(file.yield_json_file_row(input_path, data_exception_handler=_handle_error,
+                                         data_exception_kwargs={})) == expected
+    assert errors == [(3, 'bad\n')]
+
+    with pytest.raises(ValueError):
+        list(file.yield_json_file_row(input_path))
+
+    errors.clear()
+    assert list(file.yield_json_file_batch(input_path, batch_size=2, data_exception_handler=_handle_error)) == \
+           [expected[:2], expected[2:]]
+    assert errors == [(3, 'bad\n')]
+
+    errors.clear()
+    assert [row for batch in file.yield_json_file_batch(input_path, batch_size=1, max_workers=2, chunk_size=10,
+                                                        data_exception_handler=_handle_error)
+            for row in batch] == expected
+    assert errors == [(3, 'bad\n')]
+
+    with pytest.raises(ValueError):
+        list(file.yield_json_file_batch(input_path))
+
+    # malformed lines that decode as a batch of the same size
+    with open(input_path, 'w') as fh:
+        fh.write('{"a": "[{\\\\"}\n1,2\n[3\n4]\n["]", "\\"["]\n')
+
+    errors.clear()
+    assert list(file.yield_json_file_batch(input_path, data_exception_handler=_handle_error)) == \
+           [[{'a': '[{\\'}, [']', '"[']]]
+    assert errors == [(2, '1,2\n'), (3, '[3\n'), (4, '4]\n')]
+
+
+def test_fixed_width_layout():
+    record_layout = [
+        {'name': 'id', 'start_position': 1, 'length': 5, 'right_justify': True},
+        {'name': 'name', 'source_name': 'full_name', 'start_position': 8, 'length': 6, 'truncate_flag': True},
+        {'name': 'status', 'length': 3, 'default_value': 'N/A'},
+        {'name': 'comment'},
+    ]
+    records = [
+        {'id': 1, 'full_name': 'Anne', 'status': 'ok', 'comment': 'first'},
+        {'id': 22, 'full_name': 'Alexander', 'status': None},
+    ]
+    layout = file.FixedWidthLayout(record_layout)
+
+    assert [layout.build_record(record) for record in records] == \
+           [file.build_fixed_length(record, record_layout) for record in records] == \
+           ['    1  Anne  ok first', '   22  AlexanN/A']
+
+    fh = io.StringIO()
+    assert layout.write_records(records, fh, batch_size=1) == 2
+    assert fh.getvalue() == '    1  Anne  ok first\n   22  AlexanN/A\n'
+
+    with pytest.raises(ValueError, match='but the current record exceeds that'):
+        layout.build_record({'id': 123456})
+
+    with pytest.raises(ValueError, match='previous field ended at position 5'):
+        file.FixedWidthLayout([{'name': 'id', 'length': 5}, {'name': 'name', 'start_position': 3, 'length': 1}])
+
+    # positions after a field without a length depend on the record
+    dynamic_layout = [{'name': 'id'}, {'name': 'name', 'length': 4}]
+    assert file.FixedWidthLayout(dynamic_layout).build_record({'id': 123, 'name': 'ab'}) == '123ab  '
+
+
+def test_yield_fixed_width_batch(tmp_path):
+    record_layout = [
+        {'name': 'id', 'start_position': 1, 'length': 5, 'right_justify': True},
+        {'name': 'name', 'start_position': 8, 'length': 6},
+        {'name': 'comment'},
+    ]
+    records = [{'id': i, 'name': f'n{i}', 'comment': f'c{i % 10}'} for i in range(25)]
+    expected = [(str(i), f'n{i}', f'c{i % 10}') for i in range(25)]
+
+    input_path = str(tmp_path / 'test.txt')
+    with open(input_path, 'w') as fh:
+        file.FixedWidthLayout(record_layout).write_records(records, fh)
+
+    batches = list(file.yield_fixed_width_batch(input_path, record_layout, batch_size=10))
+    assert [row for batch in batches for row in batch] == expected
+    assert len(batches) == 3
+
+    # records of different lengths and a last line without a newline
+    with open(input_path, 'wb') as fh:
+        fh.write('    1  é\r\n   22  abcdefxyz  \r\n  333'.encode('utf-8'))
+
+    assert [row for batch in file.yield_fixed_width_batch(input_path, record_layout) for row in batch] == \
+           [('1', 'é', ''), ('22', 'abcdef', 'xyz'), ('333', '', '')]
+    assert next(file.yield_fixed_width_batch(input_path, record_layout, output='columns')) == \
+           {'id': ['1', '22'], 'name': ['é', 'abcdef'], 'comment': ['', 'xyz']}
+
+    # fixed length records without line terminators
+    with open(input_path, 'wb') as fh:
+        fh.write(b'    1  ab    c    2  cd    d')
+
+    assert list(file.yield_fixed_width_batch(input_path, record_layout, record_length=14)) == \
+           [[('1', 'ab', 'c'), ('2', 'cd', 'd')]]
+
+    # left-justified fields only, as text and as bytes
+    left_layout = [{'name': 'code', 'length': 3}, {'name': 'name', 'length': 4}]
+    for name in ('ab', 'é'):
+        with open(input_path, 'wb') as fh:
+            fh.write(f'1  {name:<4}\n22 cd\n'.encode('utf-8'))
+
+        assert list(file.yield_fixed_width_batch(input_path, left_layout)) == [[('1', name), ('22', 'cd')]]
+
+
+def test_get_file_etag(tmp_path):
+    content = os.urandom(2500)
+    input_path = str(tmp_path / 'test.bin')
+    with open(input_path, 'wb') as fh:
+        fh.write(content)
+
+    assert file.get_file_md5sum(input_path, chunk_size=100) == util.get_md5sum(content)
+
+    etag = util.S3ETagHasher(part_size=1000, multipart_threshold=1000).update(content).etag()
+    assert etag.endswith('-3"')
+    assert file.get_file_etag(input_path, part_size=1000, multipart_threshold=1000) == etag
+    assert file.get_file_etag(input_path, part_size=1000, multipart_threshold=1000, max_workers=2,
+                              chunk_size=300) == etag
+
+
+def test_write_parquet_files(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    column_list = [
+        {'Name': 'id', 'Type': 'bigint'},
+        {'Name': 'price', 'Type': 'decimal(10,2)'},
+        {'Name': 'flag', 'Type': 'boolean'},
+        {'Name': 'day', 'Type': 'date'},
+        {'Name': 'ts', 'Type': 'timestamp'},
+        {'Name': 'name', 'Type': 'string'},
+    ]
+
+    # csv rows have string values
+    input_path = str(tmp_path / 'test.csv')
+    with open(input_path, 'w') as fh:
+        fh.write('id,price,flag,day,ts,name\n')
+        for i in range(1000):
+            fh.write(f'{i},{i}.50,{"true" if i % 2 else "false"},2021-01-02,2021-01-02 07:00:00,'
+                     f'{"" if i % 3 else "é"}\n')
+
+    output_path = str(tmp_path / 'parquet')
+    file_paths = file.write_parquet_files(file.yield_csv_file_row(input_path, data_exception_kwargs={}), column_list,
+                                          output_path, row_group_size=100, max_file_size=8 * 1024)
+
+    assert len(file_paths) > 1
+    assert all(path.endswith('.snappy.parquet') for path in file_paths)
+
+    table = pq.read_table(output_path)
+    assert table.num_rows == 1000
+    assert [str(field.type) for field in table.schema] == \
+           ['int64', 'decimal128(10, 2)', 'bool', 'date32[day]', 'timestamp[ms]', 'string']
+    assert table.slice(0, 2).to_pylist() == [
+        {'id': 0, 'price': Decimal('0.50'), 'flag': False, 'day': date(2021, 1, 2), 'ts': datetime(2021, 1, 2, 7),
+         'name': 'é'},
+        {'id': 1, 'price': Decimal('1.50'), 'flag': True, 'day': date(2021, 1, 2), 'ts': datetime(2021, 1, 2, 7),
+         'name': None},
+    ]
+
+    metadata = pq.ParquetFile(file_paths[0]).metadata
+    assert metadata.row_group(0).num_rows == 100
+    assert metadata.row_group(0).column(0).compression == 'SNAPPY'
+
+    # typed rows in column order
+    file_paths = file.write_parquet_files([(1, None, True, date(2021, 1, 2), datetime(2021, 1, 2), 'a')], column_list,
+                                          str(tmp_path / 'parquet2'))
+    assert pq.read_table(file_paths[0]).to_pylist()[0]['day'] == date(2021, 1, 2)
+
+    with pytest.raises(ValueError, match='Unsupported column type'):
+        file.write_parquet_files([], [{'Name': 'tags', 'Type': 'array<string>'}], output_path)
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from helpers import log
+
+
+def _log_in_worker(i):
+    log.get_logger('test_process.log').info(f'worker message {i}')
+    return os.getpid()
+
+
+def test_get_logger_cached(tmp_path):
+    logger = log.get_logger('test_cached.log', path=str(tmp_path))
+
+    assert log.get_logger('test_cached.log', path=str(tmp_path)) is logger
+    assert log.get_logger('test_cached.log', path=str(tmp_path), level='debug').level == log.logging.DEBUG
+    assert log.get_logger('test_cached.log', path=str(tmp_path)).level == log.logging.DEBUG
+    assert log.get_log_file_name() == log.get_log_file_name()
+
+
+def test_queue_logging(tmp_path, monkeypatch):
+    # pytest handlers on the root logger would be used instead
+    monkeypatch.setattr(log.logging.getLogger(), 'handlers', [])
+
+    log.set_queue_logging()
+    try:
+        logger = log.get_logger('test_queue.log', path=str(tmp_path))
+        assert [type(handler) for handler in logger.handlers] == [log.logging.handlers.QueueHandler]
+
+        logger.info('queued message')
+    finally:
+        log.set_queue_logging(False)
+        log.stop_queue_logging()
+
+    assert not logger.handlers
+    with open(os.path.join(str(tmp_path), 'test_queue.log')) as fh:
+        assert 'queued message' in fh.read()
+
+
+def test_process_logging(tmp_path):
+    listener = log.start_process_logging('test_process.log', path=str(tmp_path))
+
+    with ProcessPoolExecutor(max_workers=2, initializer=log.init_process_logging,
+                             initargs=(listener.queue, 'test_process.log')) as executor:
+        list(executor.map(_log_in_worker, range(10)))
+
+    listener.stop()
+
+    with open(os.path.join(str(tmp_path), 'test_process.log')) as fh:
+        lines = fh.read().splitlines()
+
+    assert sorted(line.rsplit(' ', 1)[-1] for line in lines) == sorted(str(i) for i in range(10))
+
+
+def test_log_sampled(caplog):
+    logger = log.logging.getLogger('test_sampled')
+
+    with caplog.at_level(log.logging.INFO, logger='test_sampled'):
+        for i in range(25):
+            log.log_sampled(logger, log.logging.INFO, "sampled %s", i, every=10)
+            log.log_sampled(logger, log.logging.DEBUG, "debug %s", i, every=10)
+
+    assert caplog.messages == ['sampled 0', 'sampled 10', 'sampled 20']
+
+
+def test_log_rate_limited(caplog, monkeypatch):
+    logger = log.logging.getLogger('test_rate_limited')
+    now = [1000.0]
+    monkeypatch.setattr(log.time, 'monotonic', lambda: now[0])
+
+    with caplog.at_level(log.logging.INFO, logger='test_rate_limited'):
+        for i in range(5):
+            log.log_rate_limited(logger, log.logging.INFO, "query %s", i, interval=60, key='test_rate_limited')
+            now[0] += 20
+
+    assert caplog.messages == ['query 0', 'query 3 (2 similar messages suppressed)']
+
+
+def test_progress_summary(caplog, monkeypatch):
+    logger = log.logging.getLogger('test_progress')
+    now = [1000.0]
+    monkeypatch.setattr(log.time, 'monotonic', lambda: now[0])
+
+    with caplog.at_level(log.logging.INFO, logger='test_progress'):
+        with log.ProgressSummary('compress', logger=logger, unit='files', interval=60) as progress:
+            for i in range(10000):
+                now[0] += 0.005
+                progress.add(byte_count=350 * 1024)
+            assert not caplog.messages
+
+            now[0] += 10
+            progress.add(count=0)
+            assert caplog.messages == ['compress: processed 10,000 files, 3.3 GB in 60s (166.7 files/s)']
+
+    assert len(caplog.messages) == 2
@@ -0,0 +1,90 @@
+import socket
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+from helpers import metrics
+from helpers.aws import s3
+
+BUCKET = 'test_bucket'
+
+
+def test_in_memory_collector():
+    collector = metrics.InMemoryCollector(buckets=[0.1, 1])
+    collector.increment('aws.calls', tags={'service': 's3', 'operation': 'GetObject'})
+    collector.increment('aws.calls', 2, tags={'service': 's3', 'operation': 'PutObject'})
+    for value in (0.05, 0.5, 5):
+        collector.observe('aws.latency', value, tags={'service': 's3'})
+
+    assert collector.get_counter('aws.calls', {'operation': 'PutObject', 'service': 's3'}) == 2
+    assert collector.get_counter_total('aws.calls', {'service': 's3'}) == 3
+    assert collector.get_histogram('aws.latency', {'service': 's3'}) == {'buckets': [1, 1, 1], 'sum': 5.55, 'count': 3}
+
+    assert collector.to_prometheus_text() == '\n'.join([
+        '# TYPE aws_calls_total counter',
+        'aws_calls_total{operation="GetObject",service="s3"} 1',
+        'aws_calls_total{operation="PutObject",service="s3"} 2',
+        '# TYPE aws_latency histogram',
+        'aws_latency_bucket{service="s3",le="0.1"} 1',
+        'aws_latency_bucket{service="s3",le="1"} 2',
+        'aws_latency_bucket{service="s3",le="+Inf"} 3',
+        'aws_latency_sum{service="s3"} 5.55',
+        'aws_latency_count{service="s3"} 3',
+    ]) + '\n'
+
+
+def test_scope():
+    assert metrics.get_collector() is None
+    metrics.increment('disabled')
+
+    with metrics.scope() as collector:
+        with metrics.timer('job.seconds'):
+            metrics.increment('job.items', 5)
+        assert metrics.get_collector() is collector
+
+    assert metrics.get_collector() is None
+    assert collector.get_counter('job.items') == 5
+    assert collector.get_histogram('job.seconds')['count'] == 1
+
+
+def test_statsd_collector():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+
+    collector = metrics.StatsdCollector(port=receiver.getsockname()[1], prefix='helpers')
+    collector.increment('aws.calls', tags={'service': 's3'})
+    collector.observe('aws.latency', 0.25)
+    collector.close()
+
+    assert receiver.recv(1024) == b'helpers.aws.calls:1|c|#service:s3'
+    assert receiver.recv(1024) == b'helpers.aws.latency:250.0|ms'
+    receiver.close()
+
+
+def test_aws_call_metrics(s3_client):
+    with metrics.scope() as collector:
+        assert s3.prefix_exists(BUCKET, 'datafiles/test.txt')
+        s3.write_file(BUCKET, 'metrics/test.txt', 'abc')
+
+    assert collector.get_counter('aws.calls', {'service': 's3', 'operation': 'ListObjectsV2'}) == 1
+    assert collector.get_counter('aws.bytes_sent', {'service': 's3', 'operation': 'PutObject'}) == 3
+    assert collector.get_histogram('aws.latency', {'service': 's3', 'operation': 'PutObject'})['count'] == 1
+
+    # disabled collection records nothing
+    assert s3.prefix_exists(BUCKET, 'datafiles/test.txt')
+    assert collector.get_counter('aws.calls', {'service': 's3', 'operation': 'ListObjectsV2'}) == 1
+
+
+def test_failed_call_raises_original_error(aws_credentials):
+    s3_client = metrics.register_client(boto3.client('s3', endpoint_url='http://127.0.0.1:1',
+                                                     config=Config(retries={'max_attempts': 0})))
+
+    with pytest.raises(EndpointConnectionError):
+        s3_client.list_buckets()
+
+    with metrics.scope() as collector:
+        with pytest.raises(EndpointConnectionError):
+            s3_client.list_buckets()
+
+    assert collector.get_counter('aws.errors', {'service': 's3', 'operation': 'ListBuckets'}) == 1
@@ -1,8 +1,15 @@
+import csv
+import gzip
+import io
+import json
 import pytest
 import os
+from datetime import datetime, timezone
+from helpers import log
 from helpers.aws import s3
 
 BUCKET = 'test_bucket'
+INVENTORY_BUCKET = 'test_inventory_bucket'
 
 
 def test_prefix_exists(s3_client):
@@ -96,3 +103,126 @@ def test_is_folder_empty():
     assert not s3.is_folder_empty(BUCKET, 'datafiles/subfolder1/')
     assert s3.is_folder_empty(BUCKET, 'datafiles/subfolder2/')
     assert s3.is_folder_empty(BUCKET, 'dummy/')
+
+
+def _put_inventory(s3_client, bucket, file_format, data_key, body, file_schema):
+    s3_client.put_object(Bucket=bucket, Key=data_key, Body=body)
+    s3_client.put_object(Bucket=bucket, Key='inventory/src/daily/2021-01-02T00-00Z/manifest.json',
+                         Body=json.dumps({
+                             'sourceBucket': INVENTORY_BUCKET,
+                             'destinationBucket': f'arn:aws:s3:::{INVENTORY_BUCKET}',
+                             'version': '2016-11-30',
+                             'creationTimestamp': '1609459200000',
+                             'fileFormat': file_format,
+                             'fileSchema': file_schema,
+                             'files': [{'key': data_key, 'size': len(body), 'MD5checksum': 'dummy'}]
+                         }))
+
+
+def test_yield_inventory_file_detail_list(s3_client):
+    s3_client.create_bucket(Bucket=INVENTORY_BUCKET)
+
+    rows = [
+        [INVENTORY_BUCKET, 'data/a+file.csv', 'true', 'false', '10', '2020-12-31T10:00:00.000Z', 'etag1', 'STANDARD'],
+        [INVENTORY_BUCKET, 'data/b.json', 'true', 'false', '20', '2020-12-31T11:00:00.000Z', 'etag2', 'STANDARD'],
+        [INVENTORY_BUCKET, 'data/c.csv', 'false', 'false', '30', '2020-12-30T11:00:00.000Z', 'etag3', 'STANDARD'],
+        [INVENTORY_BUCKET, 'data/d.csv', 'true', 'true', '', '2020-12-31T12:00:00.000Z', '', ''],
+        [INVENTORY_BUCKET, 'data/folder/', 'true', 'false', '0', '2020-12-31T12:00:00.000Z', 'etag4', 'STANDARD'],
+        [INVENTORY_BUCKET, 'other/e.csv', 'true', 'false', '40', '2020-12-31T13:00:00.000Z', 'etag5', 'STANDARD'],
+    ]
+    csv_buffer = io.StringIO()
+    csv.writer(csv_buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    _put_inventory(s3_client, INVENTORY_BUCKET, 'CSV', 'inventory/src/daily/data/part1.csv.gz',
+                   gzip.compress(csv_buffer.getvalue().encode('utf-8')),
+                   'Bucket, Key, IsLatest, IsDeleteMarker, Size, LastModifiedDate, ETag, StorageClass')
+
+    manifest_key = s3.get_latest_inventory_manifest_key(INVENTORY_BUCKET, 'inventory/src/daily/')
+    assert manifest_key == 'inventory/src/daily/2021-01-02T00-00Z/manifest.json'
+
+    file_details = list(s3.yield_inventory_file_detail_list(INVENTORY_BUCKET, manifest_key, prefix='data/'))
+    assert [f['Key'] for f in file_details] == ['data/a file.csv', 'data/b.json']
+    assert file_details[0] == {'Key': 'data/a file.csv',
+                               'LastModified': datetime(2020, 12, 31, 10, tzinfo=timezone.utc),
+                               'ETag': '"etag1"',
+                               'Size': 10,
+                               'StorageClass': 'STANDARD'}
+
+    assert [f['Key'] for f in s3.yield_inventory_file_detail_list(INVENTORY_BUCKET, manifest_key,
+                                                                  include_suffix='.csv')] == \
+           ['data/a file.csv', 'other/e.csv']
+    assert len(list(s3.yield_inventory_file_detail_list(INVENTORY_BUCKET, manifest_key, max_keys=1))) == 1
+
+    # keys written after the snapshot are merged in from a LIST of the recent prefix
+    s3_client.put_object(Bucket=INVENTORY_BUCKET, Key='data/b.json', Body='{}')
+    s3_client.put_object(Bucket=INVENTORY_BUCKET, Key='data/new.json', Body='{}')
+    file_details = list(s3.yield_inventory_file_detail_list(INVENTORY_BUCKET, manifest_key, prefix='data/',
+                                                            recent_prefixes=['data/']))
+    assert [f['Key'] for f in file_details] == ['data/a file.csv', 'data/b.json', 'data/new.json']
+    assert file_details[1]['Size'] == 2
+
+
+def test_yield_inventory_file_detail_list_parquet(s3_client):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    table = pa.table({
+        'bucket': [INVENTORY_BUCKET, INVENTORY_BUCKET],
+        'key': ['data/a file.csv', 'data/b.csv'],
+        'size': [10, 20],
+        'last_modified_date': pa.array([datetime(2020, 12, 31, 10), datetime(2020, 12, 31, 11)],
+                                       type=pa.timestamp('ms')),
+        'e_tag': ['etag1', 'etag2'],
+        'is_delete_marker': [False, True],
+    })
+    parquet_buffer = io.BytesIO()
+    pq.write_table(table, parquet_buffer)
+    _put_inventory(s3_client, INVENTORY_BUCKET, 'Parquet', 'inventory/src/daily/data/part1.parquet',
+                   parquet_buffer.getvalue(), 'message s3.inventory { }')
+
+    file_details = list(s3.yield_inventory_file_detail_list(
+        INVENTORY_BUCKET, 'inventory/src/daily/2021-01-02T00-00Z/manifest.json'))
+    assert file_details == [{'Key': 'data/a file.csv',
+                             'LastModified': datetime(2020, 12, 31, 10, tzinfo=timezone.utc),
+                             'ETag': '"etag1"',
+                             'Size': 10}]
+
+
+def test_is_file_etag_equal(s3_client, tmp_path):
+    from boto3.s3.transfer import TransferConfig
+
+    local_file = str(tmp_path / 'test.bin')
+    with open(local_file, 'wb') as fh:
+        fh.write(os.urandom(6 * 1024 * 1024))
+
+    part_size = 5 * 1024 * 1024
+    s3_client.upload_file(local_file, BUCKET, 'etag/test.bin',
+                          Config=TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size))
+    s3.upload_file(local_file, BUCKET, 'etag/test_single_part.bin', s3_client=s3_client)
+
+    assert s3.is_file_etag_equal(local_file, BUCKET, 'etag/test.bin', part_size=part_size,
+                                 multipart_threshold=part_size, max_workers=2)
+    assert not s3.is_file_etag_equal(local_file, BUCKET, 'etag/test.bin')
+    assert s3.is_file_etag_equal(local_file, BUCKET, 'etag/test_single_part.bin')
+
+
+def test_download_file(s3_client, tmp_path):
+    download_path = s3.download_file(BUCKET, 'datafiles/test.txt', download_dir=str(tmp_path / 'downloads'))
+    assert download_path == str(tmp_path / 'downloads' / 'test.txt')
+
+    local_file_name = str(tmp_path / 'renamed.txt')
+    assert s3.download_file(BUCKET, 'datafiles/test.txt', local_file_name=local_file_name) == local_file_name
+    assert open(download_path, 'rb').read() == open(local_file_name, 'rb').read() == \
+           s3_client.get_object(Bucket=BUCKET, Key='datafiles/test.txt')['Body'].read()
+
+
+def test_file_transfer_handler_progress(s3_client):
+    s3_client.put_object(Bucket=BUCKET, Key='transfer/a.txt', Body=b'line 1\n')
+    s3_client.put_object(Bucket=BUCKET, Key='transfer/b.txt', Body=b'line 2\n')
+
+    with log.ProgressSummary('compress', unit='files') as progress:
+        for key in ('transfer/a.txt', 'transfer/b.txt'):
+            assert s3.compress(BUCKET, key, s3_client=s3_client, progress=progress) == 1
+    assert (progress.count, progress.byte_count) == (2, 14)
+
+    assert s3.compress(BUCKET, 'transfer/a.txt.gz', s3_client=s3_client, destination_folder='transfer/gz') == 1
+    assert sorted(s3.yield_file_list(BUCKET, 'transfer')) == ['transfer/b.txt.gz', 'transfer/gz/a.txt.gz.gz']
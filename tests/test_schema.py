@@ -0,0 +1,76 @@
+import simplejson as json
+from helpers import schema
+
+
+def test_infer_value_type():
+    assert schema.infer_value_type(None) is None
+    assert schema.infer_value_type('  ') is None
+    assert schema.infer_value_type(True) == 'boolean'
+    assert schema.infer_value_type('FALSE') == 'boolean'
+    assert schema.infer_value_type(12) == 'bigint'
+    assert schema.infer_value_type('-12') == 'bigint'
+    assert schema.infer_value_type(str(2 ** 64)) == 'string'
+    assert schema.infer_value_type('1.5e3') == 'double'
+    assert schema.infer_value_type('2021-01-31') == 'date'
+    assert schema.infer_value_type('2021-02-31') == 'string'
+    assert schema.infer_value_type('2021-01-31 07:00:01.123') == 'timestamp'
+    assert schema.infer_value_type('01/31/2021 7:00 PM') == 'timestamp'
+    assert schema.infer_value_type('march') == 'string'
+    assert schema.infer_value_type({'a': 1}) == 'string'
+
+
+def test_widen_type():
+    assert schema.widen_type(None, 'bigint') == 'bigint'
+    assert schema.widen_type('double', 'bigint') == 'double'
+    assert schema.widen_type('date', 'timestamp') == 'timestamp'
+    assert schema.widen_type('date', 'bigint') == 'string'
+    assert schema.infer_column_type(['', None]) == 'string'
+
+
+def test_sample_rows():
+    rows = schema.sample_rows(iter(range(1000)), 50, random_seed=1)
+    assert len(rows) == 50 == len(set(rows))
+    assert rows == sorted(rows)
+    assert rows[-1] >= 50
+    assert rows == schema.sample_rows(iter(range(1000)), 50, random_seed=1)
+
+    assert schema.sample_rows(iter(range(10)), 50) == list(range(10))
+    assert max(schema.sample_rows(iter(range(1000)), 50, max_scan_rows=100)) < 100
+
+
+def test_infer_csv_file_columns(tmp_path):
+    input_path = str(tmp_path / 'test.csv')
+    with open(input_path, 'w') as fh:
+        fh.write('id,price,flag,day,ts,name,empty\n')
+        for i in range(500):
+            fh.write(f'{i},{i if i % 2 else i + 0.5},{i % 2 == 0},2021-01-{i % 28 + 1:02},'
+                     f'{"2021-01-01" if i % 2 else "2021-01-01T07:00:00Z"},name {i},\n')
+
+    assert schema.infer_csv_file_columns(input_path, sample_size=100, column_mapping={'id': 'row_id'}) == [
+        {'Name': 'row_id', 'Type': 'bigint'},
+        {'Name': 'price', 'Type': 'double'},
+        {'Name': 'flag', 'Type': 'boolean'},
+        {'Name': 'day', 'Type': 'date'},
+        {'Name': 'ts', 'Type': 'timestamp'},
+        {'Name': 'name', 'Type': 'string'},
+        {'Name': 'empty', 'Type': 'string'},
+    ]
+
+    assert schema.infer_csv_file_columns(input_path, has_header=False, max_scan_rows=1)[0] == \
+           {'Name': 'col0', 'Type': 'string'}
+
+
+def test_infer_json_file_columns(tmp_path):
+    input_path = str(tmp_path / 'test.json')
+    with open(input_path, 'w') as fh:
+        for i in range(500):
+            fh.write(json.dumps({'id': i, 'score': i / 3, 'tags': ['a'], 'day': '2021-01-01'}) + '\n\n')
+        fh.write(json.dumps({'id': 'x', 'extra': None}) + '\n')
+
+    assert schema.infer_json_file_columns(input_path, sample_size=1000) == [
+        {'Name': 'id', 'Type': 'string'},
+        {'Name': 'score', 'Type': 'double'},
+        {'Name': 'tags', 'Type': 'string'},
+        {'Name': 'day', 'Type': 'date'},
+        {'Name': 'extra', 'Type': 'string'},
+    ]
@@ -0,0 +1,55 @@
+import pytest
+import simplejson as json
+from concurrent.futures import ThreadPoolExecutor
+from helpers import trace
+from helpers.aws import s3
+
+BUCKET = 'test_bucket'
+
+
+@trace.traced
+def _traced_add(a, b):
+    with trace.span('inner', value=a):
+        return a + b
+
+
+def test_span(tmp_path):
+    assert _traced_add(1, 2) == 3
+    assert trace.get_tracer() is None
+
+    with trace.tracing() as tracer:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='worker') as executor:
+            assert list(executor.map(_traced_add, [1, 2], [3, 4])) == [4, 6]
+
+        with pytest.raises(ValueError):
+            with trace.span('failed'):
+                raise ValueError('bad')
+
+    assert trace.get_tracer() is None
+
+    outer_spans = tracer.get_spans('test_trace._traced_add')
+    inner_spans = tracer.get_spans('inner')
+    assert len(outer_spans) == len(inner_spans) == 2
+    assert sorted(span['args']['value'] for span in inner_spans) == ['1', '2']
+    assert tracer.get_spans('failed')[0]['args'] == {'error': "ValueError('bad')"}
+
+    # inner spans are nested in the outer span on the same thread
+    for outer_span in outer_spans:
+        assert any(span['tid'] == outer_span['tid'] and outer_span['ts'] <= span['ts'] and
+                   span['ts'] + span['dur'] <= outer_span['ts'] + outer_span['dur'] for span in inner_spans)
+
+    trace_path = str(tmp_path / 'trace.json')
+    tracer.write_chrome_trace(trace_path)
+    with open(trace_path) as fh:
+        chrome_trace = json.load(fh)
+
+    thread_names = [event['args']['name'] for event in chrome_trace['traceEvents'] if event['ph'] == 'M']
+    assert any(name.startswith('worker') for name in thread_names)
+    assert len([event for event in chrome_trace['traceEvents'] if event['ph'] == 'X']) == 5
+
+
+def test_traced_aws_helpers(s3_client):
+    with trace.tracing() as tracer:
+        assert s3.prefix_exists(BUCKET, 'datafiles/test.txt')
+
+    assert len(tracer.get_spans('aws.s3.prefix_exists')) == 1
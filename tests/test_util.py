@@ -1,4 +1,8 @@
+import hashlib
+import io
+import time
 import pytest
+from datetime import date, datetime
 from helpers import util
 
 
@@ -61,3 +65,125 @@ def test_convert_json_to_string():
     assert util.convert_json_to_string('ac') == '"ac"'
     assert util.convert_json_to_string({'key': 'value'}) == '{"key": "value"}'
     assert util.convert_json_to_string({'key': [{'key2': 'value'}]}) == '{"key": [{"key2": "value"}]}'
+    assert util.convert_json_to_string({'key': date(2021, 1, 2), 'value': 1e20}) == \
+           '{"key": "2021-01-02", "value": 1e+20}'
+
+
+def test_get_json_loads():
+    for backend in ('auto', 'simplejson'):
+        json_loads = util.get_json_loads(backend)
+        assert json_loads(b'{"key": "\xc3\xa9", "big": 123456789012345678901234567890}') == \
+               {'key': 'é', 'big': 123456789012345678901234567890}
+        assert json_loads('[1, 2.5, null]') == [1, 2.5, None]
+
+    with pytest.raises(ValueError):
+        util.get_json_loads('dummy')
+
+
+def test_detect_date_format():
+    assert util.detect_date_format(['2021-01-31', '', None, '2021-02-01 07:00:00']) == util.ISO_DATE_FORMAT
+    assert util.detect_date_format(['01/02/2021', '12/31/2021']) == '%m/%d/%Y'
+    assert util.detect_date_format(['01/02/2021', '31/12/2021']) == '%d/%m/%Y'
+    assert util.detect_date_format(['ac', '']) is None
+
+
+def test_convert_dates():
+    values = ['01/02/2021', '', '12/31/2021', 'Feb 3rd 2021', '01/02/2021', 'ac']
+    assert util.convert_dates(values) == \
+           ([datetime(2021, 1, 2), None, datetime(2021, 12, 31), datetime(2021, 2, 3), datetime(2021, 1, 2), None], 2)
+    assert util.convert_dates(['2021-01-02'], date_format='%Y-%m-%d') == ([datetime(2021, 1, 2)], 0)
+    assert util.convert_dates(['2021-01-02', 5, 1.5, datetime(2021, 1, 3, 7), date(2021, 1, 4)]) == \
+           ([datetime(2021, 1, 2), None, None, datetime(2021, 1, 3, 7), date(2021, 1, 4)], 0)
+
+    with pytest.raises(ValueError, match='Unsupported output'):
+        util.convert_dates(values, output='list')
+
+
+def test_convert_dates_numpy():
+    np = pytest.importorskip('numpy')
+
+    converted, slow_path_count = util.convert_dates(['2021-01-02 07:00:00', None], output='numpy')
+    assert converted.tolist() == [datetime(2021, 1, 2, 7), None] and slow_path_count == 0
+
+    converted, slow_path_count = util.convert_dates(['2021-01-02T07:00:00+01:00', 'Jan 2 2021'], output='numpy')
+    assert converted.dtype == np.dtype('datetime64[us]')
+    assert converted.tolist() == [datetime(2021, 1, 2, 6), datetime(2021, 1, 2)] and slow_path_count == 1
+
+    converted, slow_path_count = util.convert_dates(['2021-01-02', 5, date(2021, 1, 4)], output='numpy')
+    assert converted.tolist() == [datetime(2021, 1, 2), None, datetime(2021, 1, 4)] and slow_path_count == 0
+
+
+def test_md5_hasher():
+    content = b'abc' * 1000
+    hasher = util.Md5Hasher().update(content[:10]).update(content[10:])
+    assert hasher.base64digest() == util.get_md5sum(content)
+    assert hasher.hexdigest() == hashlib.md5(content).hexdigest()
+
+
+def test_s3_etag_hasher():
+    content = bytes(range(256)) * 10
+    part_digests = [hashlib.md5(content[i:i + 1000]).digest() for i in range(0, len(content), 1000)]
+    multipart_etag = f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-3"'
+
+    hasher = util.S3ETagHasher(part_size=1000, multipart_threshold=1000)
+    for i in range(0, len(content), 300):
+        hasher.update(content[i:i + 300])
+    assert hasher.etag() == multipart_etag
+
+    assert util.S3ETagHasher(part_size=1000).update(content).etag() == f'"{hashlib.md5(content).hexdigest()}"'
+    assert util.S3ETagHasher().etag() == f'"{hashlib.md5(b"").hexdigest()}"'
+
+
+def test_get_json_dumps():
+    record = {'id': 1, 'day': date(2021, 1, 2), 'time': datetime(2021, 1, 2, 7), 'name': 'Zoë', 'tags': [None, True]}
+    expected = '{"id":1,"day":"2021-01-02","time":"2021-01-02 07:00:00","name":"Zoë","tags":[null,true]}'
+
+    assert util.get_json_dumps('simplejson')(record) == expected.encode('utf-8')
+    assert util.get_json_dumps('auto')(record) == expected.encode('utf-8')
+    assert util.get_json_dumps('auto')({'big': 2 ** 70}) == b'{"big":1180591620717411303424}'
+
+
+def test_write_ndjson():
+    records = [{'id': i, 'name': 'Zoë'} for i in range(5)]
+    expected = ''.join(f'{{"id":{i},"name":"Zoë"}}\n' for i in range(5))
+
+    fh = io.BytesIO()
+    assert util.write_ndjson(records, fh, batch_size=2) == 5
+    assert fh.getvalue() == expected.encode('utf-8')
+
+    fh = io.StringIO()
+    assert util.write_ndjson(iter(records), fh, json_backend='simplejson') == 5
+    assert fh.getvalue() == expected
+
+
+def _slow_range(count, delay, produced, fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise ValueError(f'bad item {i}')
+        time.sleep(delay)
+        produced.append(i)
+        yield i
+
+
+def test_prefetch():
+    produced = []
+    start_time = time.perf_counter()
+    consumed = []
+    for item in util.prefetch(_slow_range(5, 0.05, produced), buffer_size=2):
+        time.sleep(0.05)
+        consumed.append(item)
+
+    # producing and consuming overlap
+    assert consumed == list(range(5))
+    assert time.perf_counter() - start_time < 0.45
+
+    with pytest.raises(ValueError, match='bad item 2'):
+        list(util.prefetch(_slow_range(5, 0, [], fail_at=2)))
+
+    # closing stops the background thread
+    produced = []
+    prefetch_iterator = util.prefetch(_slow_range(1000, 0.001, produced), buffer_size=2)
+    assert next(prefetch_iterator) == 0
+    prefetch_iterator.close()
+    time.sleep(0.3)
+    assert len(produced) < 10